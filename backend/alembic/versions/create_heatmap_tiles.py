@@ -0,0 +1,30 @@
+"""create heatmap_tiles table
+
+Revision ID: create_heatmap_tiles
+Revises: create_report_log_checkpoints
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'create_heatmap_tiles'
+down_revision = 'create_report_log_checkpoints'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('heatmap_tiles',
+        sa.Column('zoom', sa.Integer(), nullable=False),
+        sa.Column('fish_type', postgresql.ENUM('треска', 'лосось', 'сельдь', 'другое', name='fishtype', create_type=False), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('x', sa.Integer(), nullable=False),
+        sa.Column('y', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('zoom', 'fish_type', 'month', 'x', 'y')
+    )
+
+def downgrade():
+    op.drop_table('heatmap_tiles')
@@ -0,0 +1,34 @@
+"""create import_progress and import_external_ids tables
+
+Revision ID: create_import_state
+Revises: create_ship_telemetry
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'create_import_state'
+down_revision = 'create_ship_telemetry'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('import_progress',
+        sa.Column('import_name', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('rows_done', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('import_name', 'kind')
+    )
+    op.create_table('import_external_ids',
+        sa.Column('import_name', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('external_id', sa.String(), nullable=False),
+        sa.Column('record_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('import_name', 'kind', 'external_id')
+    )
+
+def downgrade():
+    op.drop_table('import_external_ids')
+    op.drop_table('import_progress')
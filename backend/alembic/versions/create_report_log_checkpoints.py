@@ -0,0 +1,25 @@
+"""create report_log_checkpoints table
+
+Revision ID: create_report_log_checkpoints
+Revises: fix_reports_defaults
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'create_report_log_checkpoints'
+down_revision = 'fix_reports_defaults'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('report_log_checkpoints',
+        sa.Column('slot', sa.String(), nullable=False),
+        sa.Column('last_sequence', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('slot')
+    )
+
+def downgrade():
+    op.drop_table('report_log_checkpoints')
@@ -0,0 +1,47 @@
+"""create ship telemetry tables
+
+Revision ID: create_ship_telemetry
+Revises: create_heatmap_tiles
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'create_ship_telemetry'
+down_revision = 'create_heatmap_tiles'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('ship_telemetry',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('ship_id', sa.Integer(), nullable=False),
+        sa.Column('recorded_at', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('speed', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ship_telemetry_ship_recorded', 'ship_telemetry', ['ship_id', 'recorded_at'])
+    op.create_index('ix_ship_telemetry_recorded_brin', 'ship_telemetry', ['recorded_at'], postgresql_using='brin')
+
+    op.create_table('ship_telemetry_rollups',
+        sa.Column('ship_id', sa.Integer(), nullable=False),
+        sa.Column('bucket_seconds', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=True),
+        sa.Column('longitude', sa.Float(), nullable=True),
+        sa.Column('speed', sa.Float(), nullable=True),
+        sa.Column('samples', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('ship_id', 'bucket_seconds', 'bucket_start')
+    )
+
+def downgrade():
+    op.drop_table('ship_telemetry_rollups')
+    op.drop_index('ix_ship_telemetry_recorded_brin', table_name='ship_telemetry')
+    op.drop_index('ix_ship_telemetry_ship_recorded', table_name='ship_telemetry')
+    op.drop_table('ship_telemetry')
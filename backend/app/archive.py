@@ -0,0 +1,256 @@
+import argparse
+import os
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from . import models
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Холодное хранилище: закрытые отчеты и уловы старше ARCHIVE_AFTER_DAYS переносятся
+# в Parquet-файлы (zstd), разложенные по каталогам <kind>/month=YYYY-MM.
+ARCHIVE_DIR = os.getenv("SEALOG_ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("SEALOG_ARCHIVE_AFTER_DAYS", "365"))
+CLOSED_REPORT_STATUSES = ("подтвержден", "отклонен", "отменен")
+
+REPORT_COLUMNS = ["id", "fish_type", "weight", "location", "notes", "status", "created_at", "user_id", "route_id"]
+CATCH_COLUMNS = ["id", "user_id", "route_id", "fish_type", "weight", "departure_time", "return_time", "coordinates"]
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Для работы с архивом требуется пакет pyarrow")
+
+
+def _schemas():
+    return {
+        "reports": pa.schema([
+            ("id", pa.int64()),
+            ("fish_type", pa.string()),
+            ("weight", pa.float64()),
+            ("location", pa.string()),
+            ("notes", pa.string()),
+            ("status", pa.string()),
+            ("created_at", pa.timestamp("us")),
+            ("user_id", pa.int64()),
+            ("route_id", pa.int64()),
+        ]),
+        "catches": pa.schema([
+            ("id", pa.int64()),
+            ("user_id", pa.int64()),
+            ("route_id", pa.int64()),
+            ("fish_type", pa.string()),
+            ("weight", pa.float64()),
+            ("departure_time", pa.timestamp("us")),
+            ("return_time", pa.timestamp("us")),
+            # Координаты точек лова рейса на момент архивации — для пересчета тепловых карт
+            ("coordinates", pa.list_(pa.string())),
+        ]),
+    }
+
+
+def _next_month(value: datetime) -> datetime:
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1)
+    return datetime(value.year, value.month + 1, 1)
+
+
+def _partitions(kind: str, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    # Отбор месячных партиций по каталогам, без чтения самих файлов
+    root = os.path.join(ARCHIVE_DIR, kind)
+    if not os.path.isdir(root):
+        return []
+    files = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("month="):
+            continue
+        month = datetime.strptime(name[len("month="):], "%Y-%m")
+        if date_from and _next_month(month) <= date_from:
+            continue
+        if date_to and month > date_to:
+            continue
+        directory = os.path.join(root, name)
+        files.extend(
+            os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(".parquet")
+        )
+    return files
+
+
+def _write_partition(db: Session, kind: str, month: datetime, rows, model):
+    directory = os.path.join(ARCHIVE_DIR, kind, f"month={month:%Y-%m}")
+    os.makedirs(directory, exist_ok=True)
+    name = f"part-{uuid.uuid4().hex}.parquet"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    path = os.path.join(directory, name)
+    pq.write_table(pa.Table.from_pylist(rows, schema=_schemas()[kind]), tmp_path, compression="zstd")
+    # Файл становится видимым только вместе с удалением строк из базы. Удаляются
+    # ровно записанные id: строки, подошедшие под условие после SELECT, остаются в базе
+    db.query(model).filter(model.id.in_([row["id"] for row in rows])).delete(synchronize_session=False)
+    db.flush()
+    os.replace(tmp_path, path)
+    try:
+        db.commit()
+    except Exception:
+        os.remove(path)
+        raise
+
+
+def archive_reports(db: Session, older_than: datetime):
+    _require_pyarrow()
+    eligible = db.query(models.Report).filter(
+        models.Report.created_at < older_than,
+        models.Report.status.in_(CLOSED_REPORT_STATUSES)
+    )
+    months = [m for (m,) in eligible.with_entities(func.date_trunc("month", models.Report.created_at)).distinct()]
+    archived = 0
+    for month in sorted(months):
+        in_month = eligible.filter(
+            models.Report.created_at >= month,
+            models.Report.created_at < _next_month(month)
+        )
+        rows = [
+            {c: getattr(r, c) for c in REPORT_COLUMNS}
+            for r in in_month.with_entities(*[getattr(models.Report, c) for c in REPORT_COLUMNS])
+        ]
+        if rows:
+            _write_partition(db, "reports", month, rows, models.Report)
+            archived += len(rows)
+    return archived
+
+
+def archive_catches(db: Session, older_than: datetime):
+    # Улов считается закрытым, когда рейс вернулся; месяц партиции — по дате возвращения
+    _require_pyarrow()
+    months = [
+        m for (m,) in db.query(func.date_trunc("month", models.Route.return_time))
+        .join(models.Catch, models.Catch.route_id == models.Route.id)
+        .filter(models.Route.return_time < older_than)
+        .distinct()
+    ]
+    archived = 0
+    for month in sorted(months):
+        route_ids = select(models.Route.id).where(
+            models.Route.return_time >= month,
+            models.Route.return_time < _next_month(month),
+            models.Route.return_time < older_than
+        )
+        coordinates = {}
+        for route_id, value in db.query(models.RouteFishingSpot.c.route_id, models.FishingSpot.coordinates) \
+                .join(models.FishingSpot, models.FishingSpot.id == models.RouteFishingSpot.c.fishing_spot_id) \
+                .filter(models.RouteFishingSpot.c.route_id.in_(route_ids)):
+            coordinates.setdefault(route_id, []).append(value)
+        rows = [
+            {
+                "id": r.id, "user_id": r.user_id, "route_id": r.route_id,
+                "fish_type": r.fish_type.value if r.fish_type else None, "weight": r.weight,
+                "departure_time": r.departure_time, "return_time": r.return_time,
+                "coordinates": coordinates.get(r.route_id, []),
+            }
+            for r in db.query(
+                models.Catch.id, models.Catch.user_id, models.Catch.route_id, models.Catch.fish_type,
+                models.Catch.weight, models.Route.departure_time, models.Route.return_time
+            ).join(models.Route, models.Catch.route_id == models.Route.id).filter(models.Catch.route_id.in_(route_ids))
+        ]
+        if rows:
+            _write_partition(db, "catches", month, rows, models.Catch)
+            archived += len(rows)
+    return archived
+
+
+def _read(files, kind: str, columns, conditions):
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    dataset = ds.dataset(files, format="parquet", schema=_schemas()[kind])
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def _ts(value: datetime):
+    return pa.scalar(value, pa.timestamp("us"))
+
+
+def has_reports(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    return bool(_partitions("reports", date_from, date_to))
+
+
+def read_reports(db: Session, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None, user_id: Optional[int] = None, limit: Optional[int] = None):
+    # Возвращает не более limit самых новых отчетов периода
+    files = _partitions("reports", date_from, date_to)
+    if not files:
+        return []
+    _require_pyarrow()
+    conditions = []
+    if date_from:
+        conditions.append(ds.field("created_at") >= _ts(date_from))
+    if date_to:
+        conditions.append(ds.field("created_at") <= _ts(date_to))
+    if user_id is not None:
+        conditions.append(ds.field("user_id") == user_id)
+    table = _read(files, "reports", REPORT_COLUMNS, conditions)
+    # Сортировка и срез выполняются в Arrow: в объекты Python превращается только страница
+    table = table.sort_by([("created_at", "descending")])
+    if limit is not None:
+        table = table.slice(0, limit)
+    rows = {row["id"]: row for row in table.to_pylist()}
+    users = {
+        u.id: u for u in db.query(models.User).filter(models.User.id.in_({r["user_id"] for r in rows.values()}))
+    }
+    # Архивные отчеты не привязаны к сессии и отдаются только на чтение
+    return [SimpleNamespace(**row, user=users.get(row["user_id"])) for row in rows.values()]
+
+
+def catch_totals(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    # Партиции по дате возвращения, а возвращение не раньше вылета: месяцы до
+    # date_from и после date_to заведомо не попадают в выборку
+    files = _partitions("catches", date_from, date_to)
+    if not files:
+        return 0.0, 0
+    _require_pyarrow()
+    # Фильтры совпадают с catch_statistics: вылет не раньше date_from, возвращение не позже date_to
+    conditions = []
+    if date_from:
+        conditions.append(ds.field("departure_time") >= _ts(date_from))
+    if date_to:
+        conditions.append(ds.field("return_time") <= _ts(date_to))
+    table = _read(files, "catches", ["id", "weight"], conditions)
+    # Дубликаты по id возможны только после сбоя между записью файла и коммитом
+    weights = dict(zip(table.column("id").to_pylist(), table.column("weight").to_pylist()))
+    return sum(w or 0.0 for w in weights.values()), len(weights)
+
+
+def catch_sources():
+    # Все архивные уловы с координатами точек лова; в файлах, записанных до появления
+    # колонки coordinates, она пуста (None)
+    files = _partitions("catches")
+    if not files:
+        return []
+    _require_pyarrow()
+    table = _read(files, "catches", ["id", "route_id", "fish_type", "weight", "departure_time", "return_time", "coordinates"], [])
+    return list({row["id"]: row for row in table.to_pylist()}.values())
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Перенос старых отчетов и уловов в архив")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+    older_than = datetime.utcnow() - timedelta(days=args.older_than_days)
+    db = SessionLocal()
+    try:
+        print(f"Отчетов перенесено в архив: {archive_reports(db, older_than)}")
+        print(f"Уловов перенесено в архив: {archive_catches(db, older_than)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
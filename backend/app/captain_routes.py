@@ -1,38 +1,80 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import datetime
-from . import models, schemas, auth
+from . import models, schemas, auth, crud, invalidation, heatmap, telemetry
 from .database import get_db
-from .decorators import require_role
+from .decorators import require_role, query_budget
+from .rate_limit import rate_limit
 
-router = APIRouter(prefix="/captain", tags=["captain"])
+router = APIRouter(prefix="/captain", tags=["captain"], dependencies=[Depends(rate_limit("captain"))])
+
+fishing_spots_cache = invalidation.TTLCache("fishing_spots", ttl=60)
+heatmap_cache = invalidation.TTLCache("heatmap", ttl=60)
+ship_ids_cache = invalidation.TTLCache("ships", ttl=60)
 
 @router.get("/routes/", response_model=List[schemas.Route])
+@query_budget(statements=2, rows=25)
 @require_role(models.UserRole.CAPTAIN)
 async def get_my_routes(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     return db.query(models.Route).filter(models.Route.captain_id == current_user.id).all()
 
 @router.get("/fishing_spots/", response_model=List[schemas.FishingSpot])
+@query_budget(statements=2, rows=25)
 @require_role(models.UserRole.CAPTAIN)
 async def get_fishing_spots(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.FishingSpot).all()
+    return fishing_spots_cache.get(None, lambda: [
+        schemas.FishingSpot.model_validate(s) for s in db.query(models.FishingSpot).all()
+    ])
 
 @router.post("/fishing_spots/", response_model=schemas.FishingSpot)
+@query_budget(statements=4, rows=5)
 @require_role(models.UserRole.CAPTAIN)
 async def create_fishing_spot(spot: schemas.FishingSpotCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_spot = models.FishingSpot(**spot.dict())
     db.add(db_spot)
     db.commit()
     db.refresh(db_spot)
+    invalidation.publish("fishing_spots")
     return db_spot
 
+@router.get("/my_fishing_spots/", response_model=schemas.UserFishingSpots)
+@query_budget(statements=2, rows=25)
+@require_role(models.UserRole.CAPTAIN)
+async def get_my_fishing_spots(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    ids = crud.get_user_fishing_spot_ids(db, user_id=current_user.id)
+    return {"user_id": current_user.id, "fishing_spot_ids": ids}
+
+@router.post("/my_fishing_spots/", response_model=schemas.UserFishingSpots)
+@query_budget(statements=4, rows=30)
+@require_role(models.UserRole.CAPTAIN)
+async def attach_my_fishing_spots(spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    ids = crud.attach_user_fishing_spots(db, user_id=current_user.id, spot_ids=spot_ids)
+    return {"user_id": current_user.id, "fishing_spot_ids": ids}
+
+@router.put("/my_fishing_spots/", response_model=schemas.UserFishingSpots)
+@query_budget(statements=5, rows=30)
+@require_role(models.UserRole.CAPTAIN)
+async def replace_my_fishing_spots(spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    ids = crud.replace_user_fishing_spots(db, user_id=current_user.id, spot_ids=spot_ids)
+    return {"user_id": current_user.id, "fishing_spot_ids": ids}
+
+@router.delete("/my_fishing_spots/", response_model=schemas.UserFishingSpots)
+@query_budget(statements=4, rows=30)
+@require_role(models.UserRole.CAPTAIN)
+async def detach_my_fishing_spots(spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    ids = crud.detach_user_fishing_spots(db, user_id=current_user.id, spot_ids=spot_ids)
+    return {"user_id": current_user.id, "fishing_spot_ids": ids}
+
 @router.post("/routes/{route_id}/comment/")
+@query_budget(statements=1, rows=1)
 @require_role(models.UserRole.CAPTAIN)
 async def add_comment(route_id: int, comment: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     return {"message": f"Комментарий к рейсу {route_id} добавлен (заглушка)", "comment": comment}
 
 @router.put("/fishing_spots/{spot_id}/time/", response_model=schemas.FishingSpot)
+@query_budget(statements=5, rows=5)
 @require_role(models.UserRole.CAPTAIN)
 async def update_fishing_spot_time(spot_id: int, arrival_time: Optional[datetime] = None, departure_time: Optional[datetime] = None, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     spot = db.query(models.FishingSpot).filter(models.FishingSpot.id == spot_id).first()
@@ -44,19 +86,27 @@ async def update_fishing_spot_time(spot_id: int, arrival_time: Optional[datetime
         spot.departure_time = departure_time
     db.commit()
     db.refresh(spot)
+    invalidation.publish("fishing_spots")
     return spot
 
 @router.post("/ships/{ship_id}/status/")
+@query_budget(statements=2, rows=25)
 @require_role(models.UserRole.CAPTAIN)
-async def set_ship_status(ship_id: int, status: str, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return {"message": f"Состояние судна {ship_id} зафиксировано (заглушка)", "status": status}
+async def set_ship_status(ship_id: int, status: str, latitude: Optional[float] = None, longitude: Optional[float] = None, speed: Optional[float] = None, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    ship_ids = ship_ids_cache.get(None, lambda: {id for (id,) in db.query(models.Ship.id)})
+    if ship_id not in ship_ids:
+        raise HTTPException(status_code=404, detail="Судно не найдено")
+    telemetry.record(ship_id, status, latitude=latitude, longitude=longitude, speed=speed)
+    return {"message": f"Состояние судна {ship_id} зафиксировано", "status": status}
 
 @router.get("/reports/standard/")
+@query_budget(statements=1, rows=1)
 @require_role(models.UserRole.CAPTAIN)
-async def get_standard_report():
+async def get_standard_report(current_user: models.User = Depends(auth.get_current_user)):
     return {"message": "Формирование стандартных отчетов для капитана. Реализовать по ТЗ."}
 
 @router.post("/reports/{report_id}/cancel", response_model=schemas.Report)
+@query_budget(statements=6, rows=5)
 @require_role(models.UserRole.CAPTAIN)
 async def cancel_report(report_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_report = db.query(models.Report).filter(models.Report.id == report_id).first()
@@ -70,6 +120,7 @@ async def cancel_report(report_id: int, db: Session = Depends(get_db), current_u
     return db_report
 
 @router.delete("/fishing_spots/{spot_id}")
+@query_budget(statements=8, rows=50)
 @require_role(models.UserRole.CAPTAIN)
 async def delete_fishing_spot(spot_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     spot = db.query(models.FishingSpot).filter(models.FishingSpot.id == spot_id).first()
@@ -78,4 +129,27 @@ async def delete_fishing_spot(spot_id: int, db: Session = Depends(get_db), curre
     
     db.delete(spot)
     db.commit()
+    invalidation.publish("fishing_spots")
     return {"message": "Точка лова успешно удалена"}
+
+@router.get("/heatmap/{fish_type}/{zoom}/{x}/{y}")
+@query_budget(statements=2, rows=5)
+@require_role(models.UserRole.CAPTAIN)
+async def get_heatmap_tile(fish_type: models.FishType, zoom: int, x: int, y: int, request: Request, months: int = Query(3, ge=1, le=120), db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if zoom not in heatmap.ZOOM_LEVELS or not (0 <= x < 2 ** zoom and 0 <= y < 2 ** zoom):
+        raise HTTPException(status_code=404, detail="Тайл не найден")
+    # Суммирование месячных тайлов — цикл на Python, поэтому вне цикла событий
+    content, etag = await run_in_threadpool(
+        heatmap_cache.get,
+        (fish_type, zoom, x, y, months),
+        lambda: heatmap.read_tile(db, fish_type, zoom, x, y, months)
+    )
+    # Тайл — массив float32 (little-endian) размером TILE_SIZE x TILE_SIZE, строки с севера на юг
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "private, max-age=60",
+        "X-Tile-Size": str(heatmap.TILE_SIZE),
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/octet-stream", headers=headers)
@@ -1,6 +1,15 @@
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
-from . import models, schemas
-from datetime import datetime
+from typing import List, Optional
+from . import models, schemas, archive
+from datetime import datetime, timezone
+
+def _naive_utc(value: Optional[datetime]):
+    # Даты в базе и архиве хранятся без часового пояса в UTC; "…Z" из запроса приводим к ним
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 def create_report(db: Session, report: schemas.ReportCreate, user_id: int):
     report_data = report.dict()
@@ -17,11 +26,26 @@ def create_report(db: Session, report: schemas.ReportCreate, user_id: int):
     db.refresh(db_report)
     return db_report
 
-def get_reports(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Report).offset(skip).limit(limit).all()
+def _get_reports_in_range(db: Session, query, skip: int, limit: int, date_from: Optional[datetime], date_to: Optional[datetime], user_id: Optional[int] = None):
+    date_from, date_to = _naive_utc(date_from), _naive_utc(date_to)
+    if date_from:
+        query = query.filter(models.Report.created_at >= date_from)
+    if date_to:
+        query = query.filter(models.Report.created_at <= date_to)
+    # Архив читается, только если запрошен период и он пересекается с архивными месяцами
+    if (date_from is None and date_to is None) or not archive.has_reports(date_from, date_to):
+        return query.offset(skip).limit(limit).all()
+    live = query.order_by(models.Report.created_at.desc()).limit(skip + limit).all()
+    archived = archive.read_reports(db, date_from=date_from, date_to=date_to, user_id=user_id, limit=skip + limit)
+    merged = sorted(live + archived, key=lambda r: r.created_at, reverse=True)
+    return merged[skip:skip + limit]
+
+def get_reports(db: Session, skip: int = 0, limit: int = 100, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    return _get_reports_in_range(db, db.query(models.Report), skip, limit, date_from, date_to)
 
-def get_user_reports(db: Session, user_id: int, skip: int = 0, limit: int = 100):
-    return db.query(models.Report).filter(models.Report.user_id == user_id).offset(skip).limit(limit).all()
+def get_user_reports(db: Session, user_id: int, skip: int = 0, limit: int = 100, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    query = db.query(models.Report).filter(models.Report.user_id == user_id)
+    return _get_reports_in_range(db, query, skip, limit, date_from, date_to, user_id=user_id)
 
 def get_route_reports(db: Session, route_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Report).filter(models.Report.route_id == route_id).offset(skip).limit(limit).all()
@@ -35,4 +59,85 @@ def update_report_status(db: Session, report_id: int, status: str):
         db_report.status = status
         db.commit()
         db.refresh(db_report)
-    return db_report 
\ No newline at end of file
+    return db_report
+
+def get_catch_statistics(db: Session, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None):
+    date_from, date_to = _naive_utc(date_from), _naive_utc(date_to)
+    query = db.query(func.coalesce(func.sum(models.Catch.weight), 0.0), func.count(models.Catch.id))
+    if date_from:
+        query = query.filter(models.Catch.route.has(models.Route.departure_time >= date_from))
+    if date_to:
+        query = query.filter(models.Catch.route.has(models.Route.return_time <= date_to))
+    total_weight, count = query.one()
+    archived_weight, archived_count = archive.catch_totals(date_from=date_from, date_to=date_to)
+    return {"total_weight": total_weight + archived_weight, "count": count + archived_count}
+
+# Управление связями точек лова без загрузки коллекций: один INSERT ... ON CONFLICT
+# DO NOTHING / DELETE ... WHERE на операцию вместо lazy-load + extend().
+
+def _spot_membership(db: Session, table, owner_column: str, owner_id: int) -> List[int]:
+    owner = table.c[owner_column]
+    return list(db.execute(
+        select(table.c.fishing_spot_id).where(owner == owner_id).order_by(table.c.fishing_spot_id)
+    ).scalars())
+
+def _attach_spots(db: Session, table, owner_column: str, owner_id: int, spot_ids: List[int]):
+    if not spot_ids:
+        return
+    # Несуществующие точки отбрасываются в SELECT, дубликаты — через ON CONFLICT
+    stmt = insert(table).from_select(
+        [owner_column, 'fishing_spot_id'],
+        select(literal(owner_id), models.FishingSpot.id).where(models.FishingSpot.id.in_(set(spot_ids)))
+    ).on_conflict_do_nothing()
+    db.execute(stmt)
+
+def _detach_spots(db: Session, table, owner_column: str, owner_id: int, spot_ids: List[int]):
+    if not spot_ids:
+        return
+    db.execute(delete(table).where(
+        table.c[owner_column] == owner_id,
+        table.c.fishing_spot_id.in_(set(spot_ids))
+    ))
+
+def _replace_spots(db: Session, table, owner_column: str, owner_id: int, spot_ids: List[int]):
+    stmt = delete(table).where(table.c[owner_column] == owner_id)
+    if spot_ids:
+        stmt = stmt.where(table.c.fishing_spot_id.notin_(set(spot_ids)))
+    db.execute(stmt)
+    _attach_spots(db, table, owner_column, owner_id, spot_ids)
+
+def get_route_fishing_spot_ids(db: Session, route_id: int):
+    return _spot_membership(db, models.RouteFishingSpot, 'route_id', route_id)
+
+def get_user_fishing_spot_ids(db: Session, user_id: int):
+    return _spot_membership(db, models.UserFishingSpot, 'user_id', user_id)
+
+def attach_route_fishing_spots(db: Session, route_id: int, spot_ids: List[int]):
+    _attach_spots(db, models.RouteFishingSpot, 'route_id', route_id, spot_ids)
+    db.commit()
+    return _spot_membership(db, models.RouteFishingSpot, 'route_id', route_id)
+
+def detach_route_fishing_spots(db: Session, route_id: int, spot_ids: List[int]):
+    _detach_spots(db, models.RouteFishingSpot, 'route_id', route_id, spot_ids)
+    db.commit()
+    return _spot_membership(db, models.RouteFishingSpot, 'route_id', route_id)
+
+def replace_route_fishing_spots(db: Session, route_id: int, spot_ids: List[int]):
+    _replace_spots(db, models.RouteFishingSpot, 'route_id', route_id, spot_ids)
+    db.commit()
+    return _spot_membership(db, models.RouteFishingSpot, 'route_id', route_id)
+
+def attach_user_fishing_spots(db: Session, user_id: int, spot_ids: List[int]):
+    _attach_spots(db, models.UserFishingSpot, 'user_id', user_id, spot_ids)
+    db.commit()
+    return _spot_membership(db, models.UserFishingSpot, 'user_id', user_id)
+
+def detach_user_fishing_spots(db: Session, user_id: int, spot_ids: List[int]):
+    _detach_spots(db, models.UserFishingSpot, 'user_id', user_id, spot_ids)
+    db.commit()
+    return _spot_membership(db, models.UserFishingSpot, 'user_id', user_id)
+
+def replace_user_fishing_spots(db: Session, user_id: int, spot_ids: List[int]):
+    _replace_spots(db, models.UserFishingSpot, 'user_id', user_id, spot_ids)
+    db.commit()
+    return _spot_membership(db, models.UserFishingSpot, 'user_id', user_id)
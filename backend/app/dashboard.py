@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select
+from starlette.concurrency import run_in_threadpool
+from . import models, crud, invalidation
+from .database import SessionLocal
+
+# Сводная панель оператора: разделы загружаются параллельно, каждый в своей
+# сессии из пула соединений, и кэшируются на несколько секунд. Одновременных
+# сессий у всех панелей вместе не больше MAX_CONNECTIONS, чтобы панели не
+# выбирали пул, нужный остальным запросам.
+SECTION_TTL = 10
+MAX_CONNECTIONS = 4
+ACTIVE_ROUTES_LIMIT = 50
+PENDING_REPORTS_LIMIT = 10
+RECENT_CATCH_DAYS = 30
+PENDING_REPORT_STATUS = "новый"
+
+_cache = invalidation.TTLCache("dashboard", ttl=SECTION_TTL)
+_connections = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+
+def _counts(db, operator_id: int):
+    ships, routes, captains = db.execute(select(
+        select(func.count(models.Ship.id)).where(models.Ship.user_id == operator_id).scalar_subquery(),
+        select(func.count(models.Route.id)).where(models.Route.operator_id == operator_id).scalar_subquery(),
+        select(func.count(models.User.id)).where(models.User.role == models.UserRole.CAPTAIN).scalar_subquery(),
+    )).one()
+    return {"ships": ships, "routes": routes, "captains": captains}
+
+
+def _active_routes(db, operator_id: int):
+    now = datetime.utcnow()
+    rows = db.query(
+        models.Route.id, models.Route.code, models.Route.ship_id, models.Route.captain_id,
+        models.Route.departure_time, models.Route.return_time
+    ).filter(
+        models.Route.operator_id == operator_id,
+        models.Route.departure_time <= now,
+        or_(models.Route.return_time.is_(None), models.Route.return_time >= now)
+    ).order_by(models.Route.departure_time.desc()).limit(ACTIVE_ROUTES_LIMIT)
+    return [dict(row._mapping) for row in rows]
+
+
+def _pending_reports(db, operator_id: int):
+    pending = db.query(models.Report).filter(models.Report.status == PENDING_REPORT_STATUS)
+    latest = pending.with_entities(
+        models.Report.id, models.Report.fish_type, models.Report.weight, models.Report.location,
+        models.Report.created_at, models.Report.user_id, models.Report.route_id
+    ).order_by(models.Report.created_at.desc()).limit(PENDING_REPORTS_LIMIT)
+    return {
+        "count": pending.with_entities(func.count(models.Report.id)).scalar(),
+        "latest": [dict(row._mapping) for row in latest],
+    }
+
+
+def _recent_catch(db, operator_id: int):
+    return crud.get_catch_statistics(db, date_from=datetime.utcnow() - timedelta(days=RECENT_CATCH_DAYS))
+
+
+SECTIONS = {
+    "counts": _counts,
+    "active_routes": _active_routes,
+    "pending_reports": _pending_reports,
+    "recent_catch": _recent_catch,
+}
+
+
+def _load(name: str, operator_id: int):
+    def loader():
+        with _connections:
+            db = SessionLocal()
+            try:
+                return SECTIONS[name](db, operator_id)
+            finally:
+                db.close()
+    return _cache.get((name, operator_id), loader)
+
+
+async def load(operator_id: int):
+    results = await asyncio.gather(*(run_in_threadpool(_load, name, operator_id) for name in SECTIONS))
+    return dict(zip(SECTIONS, results))
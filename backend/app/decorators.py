@@ -14,4 +14,11 @@ def require_role(role: models.UserRole):
                 )
             return await func(*args, **kwargs)
         return wrapper
-    return decorator 
\ No newline at end of file
+    return decorator
+
+def query_budget(statements: int, rows: int):
+    # Бюджет SQL-запросов и выбранных строк на один вызов; проверяется в tests/test_query_budget.py
+    def decorator(func):
+        func.query_budget = {"statements": statements, "rows": rows}
+        return func
+    return decorator
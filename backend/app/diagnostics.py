@@ -0,0 +1,161 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import fastapi.routing
+from fastapi import Request
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+from .database import engine
+
+# Диагностика производительности: сэмплирующий профайлер по запросу и захват
+# медленных запросов в кольцевой буфер. Для каждого запроса учитывается время
+# SQL, сериализации ответа и bcrypt; у самых долгих SELECT медленного запроса
+# дополнительно снимается EXPLAIN.
+SLOW_REQUEST_MS = float(os.getenv("SEALOG_SLOW_REQUEST_MS", "1000"))
+SLOW_REQUEST_BUFFER = 100
+MAX_CAPTURED_STATEMENTS = 50
+EXPLAIN_STATEMENTS = 5
+
+slow_requests = deque(maxlen=SLOW_REQUEST_BUFFER)
+_background = set()
+
+_current = ContextVar("request_profile", default=None)
+_profile_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.timings = Counter()
+        self.statements = []
+
+
+@contextmanager
+def timed(section: str):
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[section] += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.diagnostics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None or context is None:
+        return
+    duration = time.perf_counter() - context.diagnostics_started
+    profile.timings["database"] += duration
+    if len(profile.statements) < MAX_CAPTURED_STATEMENTS:
+        profile.statements.append((statement, None if executemany else parameters, duration))
+
+
+def install():
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+    # FastAPI вызывает serialize_response по имени модуля, поэтому обертки достаточно
+    serialize_response = fastapi.routing.serialize_response
+
+    async def timed_serialize_response(*args, **kwargs):
+        with timed("serialization"):
+            return await serialize_response(*args, **kwargs)
+
+    fastapi.routing.serialize_response = timed_serialize_response
+
+
+def _explain(statements):
+    selects = sorted(
+        (s for s in statements if s[0].lstrip().upper().startswith("SELECT")),
+        key=lambda s: s[2], reverse=True
+    )[:EXPLAIN_STATEMENTS]
+    plans = {}
+    with engine.connect() as conn:
+        for statement, parameters, _ in selects:
+            try:
+                rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters or ()).fetchall()
+                plans[statement] = "\n".join(row[0] for row in rows)
+            except Exception as e:
+                conn.rollback()
+                plans[statement] = f"EXPLAIN failed: {str(e)}"
+    return plans
+
+
+def _capture(request: Request, status_code: int, started_at: datetime, duration: float, profile: RequestProfile):
+    # EXPLAIN выполняется вне профиля запроса, чтобы не искажать его собственные замеры
+    plans = _explain(profile.statements)
+    route = request.scope.get("route")
+    timings = {section: round(seconds * 1000, 3) for section, seconds in profile.timings.items()}
+    timings["other"] = round(max(duration - sum(profile.timings.values()), 0) * 1000, 3)
+    slow_requests.append({
+        "method": request.method,
+        "path": request.url.path,
+        "route": getattr(route, "path", None),
+        "status": status_code,
+        "started_at": started_at.isoformat(),
+        "duration_ms": round(duration * 1000, 3),
+        "timings_ms": timings,
+        "statements": [
+            {"sql": statement, "duration_ms": round(seconds * 1000, 3), "explain": plans.get(statement)}
+            for statement, _, seconds in profile.statements
+        ],
+    })
+
+
+async def slow_request_middleware(request: Request, call_next):
+    profile = RequestProfile()
+    token = _current.set(profile)
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _current.reset(token)
+    duration = time.perf_counter() - started
+    if duration * 1000 >= SLOW_REQUEST_MS:
+        task = asyncio.create_task(run_in_threadpool(_capture, request, response.status_code, started_at, duration, profile))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+    return response
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float):
+    # Возвращает стеки в свернутом формате flamegraph: "поток;внешний;...;внутренний количество"
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        counts = Counter()
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                counts[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+    finally:
+        _profile_lock.release()
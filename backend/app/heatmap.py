@@ -0,0 +1,213 @@
+import argparse
+import hashlib
+import sys
+import zlib
+from array import array
+from datetime import date, datetime
+from sqlalchemy import text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from . import models, archive
+
+# Тепловые карты улова по видам рыбы. Вес улова делится поровну между точками
+# лова рейса и раскладывается по сетке TILE_SIZE x TILE_SIZE в равнопромежуточных
+# тайлах каждого уровня масштаба. Тайлы хранятся помесячно как сжатые массивы
+# float32; окно в N месяцев получается суммированием месячных тайлов.
+# Изменение точек лова уже завершенного рейса не пересчитывается инкрементально —
+# для этого служит python -m app.heatmap; он учитывает и уловы, перенесенные в архив.
+# Уловы, загруженные app.importer, минуют add_catch: импортер сам вызывает rebuild.
+ZOOM_LEVELS = range(0, 9)
+TILE_SIZE = 64
+HEATMAP_LOCK_ID = 7_310_001
+
+
+def _month(route_return: datetime, route_departure: datetime):
+    moment = route_return or route_departure
+    if moment is None:
+        return None
+    return date(moment.year, moment.month, 1)
+
+
+def _parse_coordinates(value: str):
+    # Формат точки лова: "широта, долгота"
+    try:
+        lat, lon = (float(part) for part in value.split(","))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def _cells(lat: float, lon: float):
+    # Для каждого масштаба: (zoom, x, y) тайла и индекс ячейки внутри него
+    for zoom in ZOOM_LEVELS:
+        n = 2 ** zoom
+        fx = min((lon + 180) / 360 * n, n - 1e-9)
+        fy = min((90 - lat) / 180 * n, n - 1e-9)
+        x, y = int(fx), int(fy)
+        col = int((fx - x) * TILE_SIZE)
+        row = int((fy - y) * TILE_SIZE)
+        yield (zoom, x, y), row * TILE_SIZE + col
+
+
+def _empty():
+    return array("f", bytes(4 * TILE_SIZE * TILE_SIZE))
+
+
+def encode(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array("f", values)
+        values.byteswap()
+    return zlib.compress(values.tobytes())
+
+
+def decode(data: bytes) -> array:
+    values = array("f")
+    values.frombytes(zlib.decompress(data))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _accumulate(tiles, fish_type, month, weight: float, coordinates):
+    points = [p for p in (_parse_coordinates(c) for c in coordinates) if p]
+    if not points or not weight or month is None:
+        return
+    share = weight / len(points)
+    for lat, lon in points:
+        for (zoom, x, y), cell in _cells(lat, lon):
+            key = (zoom, fish_type, month, x, y)
+            if key not in tiles:
+                tiles[key] = _empty()
+            tiles[key][cell] += share
+
+
+def _catch_sources(db: Session, catch_filter=None):
+    query = db.query(
+        models.Catch.id, models.Catch.fish_type, models.Catch.weight,
+        models.Route.return_time, models.Route.departure_time, models.FishingSpot.coordinates
+    ).join(models.Route, models.Catch.route_id == models.Route.id) \
+        .join(models.RouteFishingSpot, models.RouteFishingSpot.c.route_id == models.Route.id) \
+        .join(models.FishingSpot, models.FishingSpot.id == models.RouteFishingSpot.c.fishing_spot_id)
+    if catch_filter is not None:
+        query = query.filter(catch_filter)
+    catches = {}
+    for catch_id, fish_type, weight, returned, departed, coordinates in query:
+        entry = catches.setdefault(catch_id, (fish_type, weight, _month(returned, departed), []))
+        entry[3].append(coordinates)
+    return catches.values()
+
+
+def _archived_catch_sources(db: Session):
+    rows = archive.catch_sources()
+    # Для архивов без сохраненных координат берем текущие точки лова рейса
+    missing = {r["route_id"] for r in rows if r["coordinates"] is None}
+    spots = {}
+    if missing:
+        for route_id, coordinates in db.query(models.RouteFishingSpot.c.route_id, models.FishingSpot.coordinates) \
+                .join(models.FishingSpot, models.FishingSpot.id == models.RouteFishingSpot.c.fishing_spot_id) \
+                .filter(models.RouteFishingSpot.c.route_id.in_(missing)):
+            spots.setdefault(route_id, []).append(coordinates)
+    for r in rows:
+        if r["fish_type"] is None:
+            continue
+        coordinates = r["coordinates"] if r["coordinates"] is not None else spots.get(r["route_id"], [])
+        yield models.FishType(r["fish_type"]), r["weight"], _month(r["return_time"], r["departure_time"]), coordinates
+
+
+def _upsert(db: Session, tiles):
+    if not tiles:
+        return
+    stmt = insert(models.HeatmapTile.__table__)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["zoom", "fish_type", "month", "x", "y"],
+            set_={"data": stmt.excluded.data}
+        ),
+        [
+            {"zoom": zoom, "fish_type": fish_type, "month": month, "x": x, "y": y, "data": encode(values)}
+            for (zoom, fish_type, month, x, y), values in tiles.items()
+        ]
+    )
+
+
+def add_catch(db: Session, catch: models.Catch):
+    # Вызывается в транзакции создания улова; блокировка исключает потерю
+    # обновлений, когда два улова одновременно создают один и тот же тайл
+    db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": HEATMAP_LOCK_ID})
+    delta = {}
+    for fish_type, weight, month, coordinates in _catch_sources(db, models.Catch.id == catch.id):
+        _accumulate(delta, fish_type, month, weight, coordinates)
+    if not delta:
+        return
+    key_columns = tuple_(
+        models.HeatmapTile.zoom, models.HeatmapTile.fish_type, models.HeatmapTile.month,
+        models.HeatmapTile.x, models.HeatmapTile.y
+    )
+    existing = db.query(
+        models.HeatmapTile.zoom, models.HeatmapTile.fish_type, models.HeatmapTile.month,
+        models.HeatmapTile.x, models.HeatmapTile.y, models.HeatmapTile.data
+    ).filter(key_columns.in_(list(delta))).all()
+    for zoom, fish_type, month, x, y, data in existing:
+        key = (zoom, fish_type, month, x, y)
+        values = decode(data)
+        for i, v in enumerate(delta[key]):
+            if v:
+                values[i] += v
+        delta[key] = values
+    _upsert(db, delta)
+
+
+def rebuild(db: Session):
+    db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": HEATMAP_LOCK_ID})
+    tiles = {}
+    for fish_type, weight, month, coordinates in _catch_sources(db):
+        _accumulate(tiles, fish_type, month, weight, coordinates)
+    for fish_type, weight, month, coordinates in _archived_catch_sources(db):
+        _accumulate(tiles, fish_type, month, weight, coordinates)
+    db.query(models.HeatmapTile).delete(synchronize_session=False)
+    _upsert(db, tiles)
+    db.commit()
+    return len(tiles)
+
+
+def window_start(months: int) -> date:
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def read_tile(db: Session, fish_type: models.FishType, zoom: int, x: int, y: int, months: int):
+    # Возвращает (данные тайла, ETag); суммируются месячные тайлы окна
+    rows = db.query(models.HeatmapTile.data).filter(
+        models.HeatmapTile.zoom == zoom,
+        models.HeatmapTile.fish_type == fish_type,
+        models.HeatmapTile.x == x,
+        models.HeatmapTile.y == y,
+        models.HeatmapTile.month >= window_start(months)
+    ).all()
+    total = _empty()
+    for (data,) in rows:
+        for i, v in enumerate(decode(data)):
+            if v:
+                total[i] += v
+    if sys.byteorder == "big":
+        total.byteswap()
+    content = total.tobytes()
+    return content, hashlib.md5(content).hexdigest()
+
+
+def main():
+    from .database import SessionLocal
+
+    argparse.ArgumentParser(description="Полный пересчет тепловых карт улова").parse_args()
+    db = SessionLocal()
+    try:
+        print(f"Тайлов тепловой карты: {rebuild(db)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from . import models, schemas, heatmap
+
+# Импорт исторических судовых журналов из CSV. Файлы читаются потоково, блоки строк
+# валидируются схемами *Create в пуле процессов, внешние ключи разрешаются по
+# словарям в памяти, запись идет пакетными INSERT. Счетчик прочитанных строк и
+# соответствие external_id -> id хранятся в import_progress и import_external_ids
+# и пишутся в той же транзакции, что и сами строки, поэтому прерванный импорт
+# перезапускается с тем же --name без повторной вставки.
+#
+# Ожидаемые колонки:
+#   ships.csv          external_id, owner_email, name, type, displacement, build_date
+#   fishing_spots.csv  external_id, name, coordinates, depth, fish_type, arrival_time, departure_time
+#   routes.csv         external_id, ship_external_id, operator_email, captain_email, code,
+#                      departure_time, return_time, fishing_spot_external_ids (через ";")
+#   catches.csv        captain_email, route_external_id, fish_type, weight
+
+KINDS = ("ships", "fishing_spots", "routes", "catches")
+SCHEMAS = {
+    "ships": schemas.ShipCreate,
+    "fishing_spots": schemas.FishingSpotCreate,
+    "routes": schemas.RouteCreate,
+    "catches": schemas.CatchCreate,
+}
+TABLES = {
+    "ships": models.Ship.__table__,
+    "fishing_spots": models.FishingSpot.__table__,
+    "routes": models.Route.__table__,
+    "catches": models.Catch.__table__,
+}
+CHUNK_SIZE = 5000
+
+
+def _validate_chunk(kind: str, first_line: int, rows):
+    # Выполняется в дочернем процессе: только разбор и валидация, без обращения к базе
+    schema = SCHEMAS[kind]
+    valid, errors = [], []
+    for line, (external_id, extra, row) in enumerate(rows, start=first_line):
+        if isinstance(row, str):
+            errors.append((line, row))
+            continue
+        try:
+            valid.append((external_id, extra, schema(**row).dict()))
+        except (ValidationError, TypeError, ValueError) as e:
+            errors.append((line, str(e).replace("\n", "; ")))
+    return valid, errors
+
+
+class Importer:
+    def __init__(self, db, name: str, errors_dir: str, workers: int = None, chunk_size: int = CHUNK_SIZE):
+        self.db = db
+        self.name = name
+        self.errors_dir = errors_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        os.makedirs(errors_dir, exist_ok=True)
+        self.state = {
+            kind: rows_done for kind, rows_done in db.execute(
+                select(models.ImportProgress.kind, models.ImportProgress.rows_done)
+                .where(models.ImportProgress.import_name == name)
+            )
+        }
+        self.users = {email: id for id, email in db.execute(select(models.User.id, models.User.email))}
+        self.maps = {kind: self._load_map(kind) for kind in ("ships", "fishing_spots", "routes")}
+
+    def _load_map(self, kind: str):
+        return {
+            external_id: record_id for external_id, record_id in self.db.execute(
+                select(models.ImportExternalId.external_id, models.ImportExternalId.record_id)
+                .where(models.ImportExternalId.import_name == self.name, models.ImportExternalId.kind == kind)
+            )
+        }
+
+    def _resolve(self, kind: str, raw: dict):
+        # Возвращает (external_id, доп. данные, строка для схемы) или текст ошибки вместо строки
+        external_id = raw.get("external_id") or None
+        # DictReader кладет лишние поля под ключ None, а недостающие заполняет None
+        if None in raw:
+            return external_id, None, f"Лишние поля: {len(raw[None])}"
+        missing = [k for k, v in raw.items() if v is None]
+        if missing:
+            return external_id, None, f"Нет значений для колонок: {', '.join(missing)}"
+        raw = {k: (v if v != "" else None) for k, v in raw.items()}
+        raw.pop("external_id", None)
+        extra = None
+        try:
+            if kind == "ships":
+                raw["user_id"] = self.users[raw.pop("owner_email")]
+            elif kind == "routes":
+                raw["ship_id"] = self.maps["ships"][raw.pop("ship_external_id")]
+                raw["operator_id"] = self.users[raw.pop("operator_email")]
+                raw["captain_id"] = self.users[raw.pop("captain_email")]
+                spots = raw.pop("fishing_spot_external_ids", None) or ""
+                extra = [self.maps["fishing_spots"][s] for s in spots.split(";") if s]
+            elif kind == "catches":
+                raw["user_id"] = self.users[raw.pop("captain_email")]
+                raw["route_id"] = self.maps["routes"][raw.pop("route_external_id")]
+        except KeyError as e:
+            return external_id, None, f"Не найдена связанная запись: {e.args[0]}"
+        return external_id, extra, raw
+
+    def _chunks(self, kind: str, path: str):
+        done = self.state.get(kind, 0)
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            # Уже загруженные строки пропускаются без разбора
+            for _ in islice(reader, done):
+                pass
+            line = done + 1
+            while True:
+                raw_rows = list(islice(reader, self.chunk_size))
+                if not raw_rows:
+                    return
+                yield line, [self._resolve(kind, r) for r in raw_rows]
+                line += len(raw_rows)
+
+    def _write(self, kind: str, valid, errors, rows_read: int):
+        table = TABLES[kind]
+        ids = []
+        if valid:
+            stmt = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+            ids = list(self.db.execute(stmt, [row for _, _, row in valid]).scalars())
+        if kind == "routes":
+            links = [
+                {"route_id": id, "fishing_spot_id": spot_id}
+                for id, (_, spots, _) in zip(ids, valid) for spot_id in spots or ()
+            ]
+            if links:
+                self.db.execute(pg_insert(models.RouteFishingSpot).on_conflict_do_nothing(), links)
+        mapped = []
+        if kind in self.maps:
+            mapped = [(external_id, id) for id, (external_id, _, _) in zip(ids, valid) if external_id]
+        if mapped:
+            stmt = pg_insert(models.ImportExternalId.__table__)
+            self.db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["import_name", "kind", "external_id"],
+                    set_={"record_id": stmt.excluded.record_id}
+                ),
+                # Повтор external_id в файле: как и в словаре, побеждает последняя строка
+                list({
+                    external_id: {"import_name": self.name, "kind": kind, "external_id": external_id, "record_id": id}
+                    for external_id, id in mapped
+                }.values())
+            )
+        rows_done = self.state.get(kind, 0) + rows_read
+        stmt = pg_insert(models.ImportProgress.__table__).values(import_name=self.name, kind=kind, rows_done=rows_done)
+        self.db.execute(stmt.on_conflict_do_update(
+            index_elements=["import_name", "kind"], set_={"rows_done": stmt.excluded.rows_done}
+        ))
+        if errors:
+            # Пишется до коммита: после сбоя ошибки блока могут повториться, но не пропадут
+            with open(os.path.join(self.errors_dir, f"{self.name}.{kind}.errors.csv"), "a", newline="") as f:
+                csv.writer(f).writerows(errors)
+        self.db.commit()
+        self.maps.get(kind, {}).update(mapped)
+        self.state[kind] = rows_done
+
+    def run(self, kind: str, path: str):
+        started = time.monotonic()
+        loaded = rejected = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            # Ограниченное окно блоков: файл не читается в память целиком
+            window = deque()
+            chunks = self._chunks(kind, path)
+            for line, rows in chunks:
+                window.append((len(rows), pool.submit(_validate_chunk, kind, line, rows)))
+                if len(window) >= self.workers * 2:
+                    loaded, rejected = self._drain_one(kind, window, loaded, rejected, started)
+            while window:
+                loaded, rejected = self._drain_one(kind, window, loaded, rejected, started)
+        elapsed = time.monotonic() - started
+        print(f"{kind}: загружено {loaded}, отклонено {rejected} за {elapsed:.1f} с ({loaded / max(elapsed, 1e-9):.0f} строк/с)")
+        if kind == "catches" and loaded:
+            # Пакетная вставка минует heatmap.add_catch: тепловые карты пересчитываются целиком
+            print(f"Тайлов тепловой карты: {heatmap.rebuild(self.db)}")
+
+    def _drain_one(self, kind: str, window, loaded: int, rejected: int, started: float):
+        rows_read, future = window.popleft()
+        valid, errors = future.result()
+        self._write(kind, valid, errors, rows_read)
+        loaded += len(valid)
+        rejected += len(errors)
+        rate = loaded / max(time.monotonic() - started, 1e-9)
+        print(f"{kind}: {loaded} строк, {rate:.0f} строк/с")
+        return loaded, rejected
+
+
+def main():
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Импорт исторических судовых журналов из CSV")
+    for kind in KINDS:
+        parser.add_argument(f"--{kind.replace('_', '-')}", dest=kind, help=f"CSV-файл {kind}")
+    parser.add_argument("--name", default="default", help="Имя импорта: под ним хранится прогресс для перезапуска")
+    parser.add_argument("--errors-dir", default="import_errors")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        importer = Importer(db, args.name, args.errors_dir, workers=args.workers, chunk_size=args.chunk_size)
+        # Порядок важен: маршруты ссылаются на суда и точки лова, уловы — на маршруты
+        for kind in KINDS:
+            path = getattr(args, kind)
+            if path:
+                importer.run(kind, path)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
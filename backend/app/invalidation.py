@@ -0,0 +1,198 @@
+import json
+import os
+import select
+import socket
+import threading
+import time
+from .database import engine
+
+# Шина инвалидации кэшей между воркерами. Обработчики записи вызывают publish()
+# после коммита: локальные кэши сбрасываются сразу, остальные воркеры получают
+# сообщение через локальный Unix-сокет или Postgres LISTEN/NOTIFY. TTL кэша
+# ограничивает устаревание, даже если сообщение потеряно.
+INVALIDATION_BACKEND = os.getenv("SEALOG_INVALIDATION_BUS", "unix")
+INVALIDATION_SOCKET_DIR = os.getenv("SEALOG_INVALIDATION_SOCKET_DIR", "/tmp/sealog-invalidation")
+NOTIFY_CHANNEL = "sealog_invalidation"
+
+_caches = {}
+
+
+class TTLCache:
+    def __init__(self, topic: str, ttl: float):
+        self.topic = topic
+        self.ttl = ttl
+        self._entries = {}
+        self._loading = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        _caches.setdefault(topic, []).append(self)
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry
+        return None
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._fresh(key)
+            if entry:
+                return entry[1]
+            loading = self._loading.setdefault(key, threading.Lock())
+        # Один загрузчик на ключ: остальные вызывающие ждут его результат
+        with loading:
+            with self._lock:
+                entry = self._fresh(key)
+                if entry:
+                    return entry[1]
+                generation = self._generation
+            now = time.monotonic()
+            value = loader()
+            with self._lock:
+                # Значение, загруженное до инвалидации, не сохраняем
+                if generation == self._generation:
+                    self._entries[key] = (now + self.ttl, value)
+                if self._loading.get(key) is loading:
+                    del self._loading[key]
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+def _invalidate_local(topic: str):
+    for cache in _caches.get(topic, ()):
+        cache.invalidate()
+
+
+def clear_all():
+    for topic in _caches:
+        _invalidate_local(topic)
+
+
+class UnixSocketBus:
+    # Каждый воркер слушает датаграммный сокет <pid>.sock в общем каталоге хоста
+    def __init__(self, directory: str = INVALIDATION_SOCKET_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    def publish(self, message: bytes):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._sender.sendto(message, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Сокет завершившегося воркера
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            except BlockingIOError:
+                # Очередь получателя переполнена: его кэш устареет не дольше TTL
+                pass
+
+    def listen(self, handler, stop: threading.Event):
+        self.sock.settimeout(0.5)
+        while not stop.is_set():
+            try:
+                handler(self.sock.recv(4096))
+            except socket.timeout:
+                continue
+
+    def close(self):
+        self.sock.close()
+        self._sender.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class PostgresBus:
+    def __init__(self):
+        self.listener = engine.raw_connection()
+        self.listener.driver_connection.set_isolation_level(0)
+        cursor = self.listener.cursor()
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        cursor.close()
+        self._publish_lock = threading.Lock()
+        self.publisher = engine.raw_connection()
+        self.publisher.driver_connection.set_isolation_level(0)
+
+    def publish(self, message: bytes):
+        with self._publish_lock:
+            cursor = self.publisher.cursor()
+            cursor.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, message.decode("utf-8")))
+            cursor.close()
+
+    def listen(self, handler, stop: threading.Event):
+        connection = self.listener.driver_connection
+        while not stop.is_set():
+            if select.select([connection], [], [], 0.5) == ([], [], []):
+                continue
+            connection.poll()
+            while connection.notifies:
+                notify = connection.notifies.pop(0)
+                handler(notify.payload.encode("utf-8"))
+
+    def close(self):
+        self.listener.close()
+        self.publisher.close()
+
+
+_bus = None
+_stop = threading.Event()
+_thread = None
+
+
+def _handle(message: bytes):
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return
+    if data.get("pid") != os.getpid():
+        _invalidate_local(data["topic"])
+
+
+def publish(topic: str):
+    _invalidate_local(topic)
+    if _bus is None:
+        return
+    try:
+        _bus.publish(json.dumps({"topic": topic, "pid": os.getpid()}).encode("utf-8"))
+    except Exception as e:
+        print(f"Invalidation publish error: {str(e)}")
+
+
+def start():
+    global _bus, _thread
+    if INVALIDATION_BACKEND == "unix":
+        _bus = UnixSocketBus()
+    elif INVALIDATION_BACKEND == "postgres":
+        _bus = PostgresBus()
+    else:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_bus.listen, args=(_handle, _stop), daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _bus
+    if _bus is None:
+        return
+    _stop.set()
+    _thread.join()
+    _bus.close()
+    _bus = None
@@ -1,17 +1,27 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from . import models, schemas, auth, crud
-from .database import engine, get_db
+from . import models, schemas, auth, crud, report_log, invalidation, diagnostics, telemetry
+from .database import engine, get_db, SessionLocal
 from .operator_routes import router as operator_router
 from .captain_routes import router as captain_router
-from typing import List
+from .rate_limit import rate_limit, concurrency_limit_middleware
+from .decorators import query_budget
+from typing import List, Optional
+from datetime import datetime
 
 models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Fishing Fleet API")
 
+# Добавляется до CORS, чтобы ответы 503 тоже получали CORS-заголовки
+app.middleware("http")(concurrency_limit_middleware)
+
+diagnostics.install()
+app.middleware("http")(diagnostics.slow_request_middleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -22,6 +32,7 @@ app.add_middleware(
 )
 
 @app.post("/register", response_model=schemas.User)
+@query_budget(statements=4, rows=5)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
     if db_user:
@@ -40,9 +51,11 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    invalidation.publish("users")
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
+@query_budget(statements=2, rows=2)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
     if not user or not auth.verify_password(form_data.password, user.hashed_password):
@@ -55,17 +68,47 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=schemas.User)
+@query_budget(statements=1, rows=1)
 async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
 
+@app.on_event("startup")
+def start_invalidation_bus():
+    invalidation.start()
+
+@app.on_event("shutdown")
+def stop_invalidation_bus():
+    invalidation.stop()
+
+@app.on_event("startup")
+def start_telemetry():
+    telemetry.start(SessionLocal)
+
+@app.on_event("shutdown")
+def stop_telemetry():
+    telemetry.stop(SessionLocal)
+
+@app.on_event("startup")
+def start_report_log():
+    if report_log.REPORT_INGEST_MODE == "log":
+        app.state.report_flusher = report_log.ReportFlusher(SessionLocal)
+        app.state.report_flusher.start()
+
+@app.on_event("shutdown")
+def stop_report_log():
+    if getattr(app.state, "report_flusher", None):
+        app.state.report_flusher.stop()
+
 app.include_router(operator_router)
 app.include_router(captain_router)
 
 @app.get("/")
+@query_budget(statements=0, rows=0)
 def read_root():
     return {"message": "Fishing Fleet API"}
 
-@app.post("/reports", response_model=schemas.Report)
+@app.post("/reports", response_model=schemas.Report, dependencies=[Depends(rate_limit("reports"))])
+@query_budget(statements=6, rows=6)
 def create_report(
     report: schemas.ReportCreate,
     db: Session = Depends(get_db),
@@ -82,22 +125,34 @@ def create_report(
         if route.captain_id != current_user.id:
             raise HTTPException(status_code=403, detail="Этот маршрут не назначен вам")
     
+    if report_log.REPORT_INGEST_MODE == "log":
+        # Отчет сохранен в локальном журнале и будет перенесен в базу фоновым потоком
+        try:
+            sequence = app.state.report_flusher.append(report.dict(), user_id=current_user.id)
+        except report_log.ReportLogError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "accepted", "sequence": sequence})
+
     return crud.create_report(db=db, report=report, user_id=current_user.id)
 
-@app.get("/reports", response_model=List[schemas.Report])
+@app.get("/reports", response_model=List[schemas.Report], dependencies=[Depends(rate_limit("reports"))])
+@query_budget(statements=5, rows=50)
 def read_reports(
     skip: int = 0,
     limit: int = 100,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     if current_user.role == "captain":
-        reports = crud.get_user_reports(db, user_id=current_user.id, skip=skip, limit=limit)
+        reports = crud.get_user_reports(db, user_id=current_user.id, skip=skip, limit=limit, date_from=date_from, date_to=date_to)
     else:
-        reports = crud.get_reports(db, skip=skip, limit=limit)
+        reports = crud.get_reports(db, skip=skip, limit=limit, date_from=date_from, date_to=date_to)
     return reports
 
-@app.post("/reports/{report_id}/approve")
+@app.post("/reports/{report_id}/approve", dependencies=[Depends(rate_limit("reports"))])
+@query_budget(statements=5, rows=5)
 def approve_report(
     report_id: int,
     db: Session = Depends(get_db),
@@ -110,7 +165,8 @@ def approve_report(
         raise HTTPException(status_code=404, detail="Отчет не найден")
     return {"status": "success"}
 
-@app.post("/reports/{report_id}/reject")
+@app.post("/reports/{report_id}/reject", dependencies=[Depends(rate_limit("reports"))])
+@query_budget(statements=5, rows=5)
 def reject_report(
     report_id: int,
     db: Session = Depends(get_db),
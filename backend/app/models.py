@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Enum, Float, Date, DateTime, ForeignKey, Table, event
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, Enum, Float, Date, DateTime, ForeignKey, Index, LargeBinary, Table, event
 from sqlalchemy.orm import relationship
 import enum
 from .database import Base
@@ -114,6 +114,66 @@ class Report(Base):
     user = relationship("User", back_populates="reports")
     route = relationship("Route", back_populates="reports")
 
+class ReportLogCheckpoint(Base):
+    __tablename__ = "report_log_checkpoints"
+
+    # Идентификатор каталога журнала (log.id); для старых каталогов — имя слота
+    slot = Column(String, primary_key=True)
+    last_sequence = Column(BigInteger, nullable=False, default=0)
+
+class HeatmapTile(Base):
+    __tablename__ = "heatmap_tiles"
+
+    zoom = Column(Integer, primary_key=True)
+    fish_type = Column(Enum(FishType), primary_key=True)
+    month = Column(Date, primary_key=True)
+    x = Column(Integer, primary_key=True)
+    y = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
+class ShipTelemetry(Base):
+    __tablename__ = "ship_telemetry"
+    # Журнал только на добавление: без внешнего ключа, чтобы удаление судна не упиралось в историю
+    __table_args__ = (
+        Index("ix_ship_telemetry_ship_recorded", "ship_id", "recorded_at"),
+        Index("ix_ship_telemetry_recorded_brin", "recorded_at", postgresql_using="brin"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    ship_id = Column(Integer, nullable=False)
+    recorded_at = Column(DateTime, nullable=False)
+    status = Column(String, nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    speed = Column(Float, nullable=True)
+
+class ShipTelemetryRollup(Base):
+    __tablename__ = "ship_telemetry_rollups"
+
+    ship_id = Column(Integer, primary_key=True)
+    bucket_seconds = Column(Integer, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    status = Column(String, nullable=False)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    speed = Column(Float, nullable=True)
+    samples = Column(Integer, nullable=False)
+
+class ImportProgress(Base):
+    __tablename__ = "import_progress"
+
+    import_name = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    rows_done = Column(BigInteger, nullable=False, default=0)
+
+class ImportExternalId(Base):
+    __tablename__ = "import_external_ids"
+
+    import_name = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    external_id = Column(String, primary_key=True)
+    record_id = Column(Integer, nullable=False)
+
 @event.listens_for(Report, 'before_insert')
 def set_created_at(mapper, connection, target):
     target.created_at = datetime.utcnow()
@@ -1,14 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-from . import models, schemas, auth
+from . import models, schemas, auth, crud, invalidation, heatmap, diagnostics, telemetry, dashboard
 from .database import get_db
-from .decorators import require_role
+from .decorators import require_role, query_budget
+from .rate_limit import rate_limit
 
-router = APIRouter(prefix="/operator", tags=["operator"])
+router = APIRouter(prefix="/operator", tags=["operator"], dependencies=[Depends(rate_limit("operator"))])
+
+ships_cache = invalidation.TTLCache("ships", ttl=30)
+captains_cache = invalidation.TTLCache("users", ttl=60)
 
 @router.post("/routes/", response_model=schemas.Route)
+@query_budget(statements=4, rows=5)
 @require_role(models.UserRole.OPERATOR)
 async def create_route(route: schemas.RouteCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_route = models.Route(**route.dict())
@@ -18,29 +25,39 @@ async def create_route(route: schemas.RouteCreate, db: Session = Depends(get_db)
     return db_route
 
 @router.post("/catch/", response_model=schemas.Catch)
+@query_budget(statements=8, rows=60)
 @require_role(models.UserRole.OPERATOR)
 async def log_catch(catch: schemas.CatchCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_catch = models.Catch(**catch.dict())
     db.add(db_catch)
+    db.flush()
+    heatmap.add_catch(db, db_catch)
     db.commit()
     db.refresh(db_catch)
+    invalidation.publish("heatmap")
     return db_catch
 
 @router.get("/ships/", response_model=List[schemas.Ship])
+@query_budget(statements=3, rows=25)
 @require_role(models.UserRole.OPERATOR)
 async def get_ships(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.Ship).filter(models.Ship.user_id == current_user.id).all()
+    return ships_cache.get(current_user.id, lambda: [
+        schemas.Ship.model_validate(s) for s in db.query(models.Ship).filter(models.Ship.user_id == current_user.id).all()
+    ])
 
 @router.post("/ships/", response_model=schemas.Ship)
+@query_budget(statements=4, rows=5)
 @require_role(models.UserRole.OPERATOR)
 async def create_ship(ship: schemas.ShipCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_ship = models.Ship(**ship.dict())
     db.add(db_ship)
     db.commit()
     db.refresh(db_ship)
+    invalidation.publish("ships")
     return db_ship
 
 @router.put("/ships/{ship_id}", response_model=schemas.Ship)
+@query_budget(statements=5, rows=5)
 @require_role(models.UserRole.OPERATOR)
 async def update_ship(ship_id: int, ship: schemas.ShipCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_ship = db.query(models.Ship).filter(models.Ship.id == ship_id).first()
@@ -50,38 +67,71 @@ async def update_ship(ship_id: int, ship: schemas.ShipCreate, db: Session = Depe
         setattr(db_ship, key, value)
     db.commit()
     db.refresh(db_ship)
+    invalidation.publish("ships")
     return db_ship
 
 @router.post("/routes/{route_id}/fishing_spots/", response_model=schemas.Route)
+@query_budget(statements=6, rows=30)
 @require_role(models.UserRole.OPERATOR)
 async def add_fishing_spot_to_route(route_id: int, spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_route = db.query(models.Route).filter(models.Route.id == route_id).first()
     if not db_route:
         raise HTTPException(status_code=404, detail="Рейс не найден")
-    spots = db.query(models.FishingSpot).filter(models.FishingSpot.id.in_(spot_ids)).all()
-    db_route.fishing_spots.extend(spots)
-    db.commit()
-    db.refresh(db_route)
+    crud.attach_route_fishing_spots(db, route_id=route_id, spot_ids=spot_ids)
+    return db_route
+
+def _get_route_or_404(db: Session, route_id: int):
+    db_route = db.query(models.Route.id).filter(models.Route.id == route_id).first()
+    if not db_route:
+        raise HTTPException(status_code=404, detail="Рейс не найден")
     return db_route
 
+@router.post("/routes/{route_id}/fishing_spots/bulk/", response_model=schemas.RouteFishingSpots)
+@query_budget(statements=6, rows=30)
+@require_role(models.UserRole.OPERATOR)
+async def attach_route_fishing_spots(route_id: int, spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    _get_route_or_404(db, route_id)
+    ids = crud.attach_route_fishing_spots(db, route_id=route_id, spot_ids=spot_ids)
+    return {"route_id": route_id, "fishing_spot_ids": ids}
+
+@router.put("/routes/{route_id}/fishing_spots/", response_model=schemas.RouteFishingSpots)
+@query_budget(statements=6, rows=30)
+@require_role(models.UserRole.OPERATOR)
+async def replace_route_fishing_spots(route_id: int, spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    _get_route_or_404(db, route_id)
+    ids = crud.replace_route_fishing_spots(db, route_id=route_id, spot_ids=spot_ids)
+    return {"route_id": route_id, "fishing_spot_ids": ids}
+
+@router.delete("/routes/{route_id}/fishing_spots/", response_model=schemas.RouteFishingSpots)
+@query_budget(statements=6, rows=30)
+@require_role(models.UserRole.OPERATOR)
+async def detach_route_fishing_spots(route_id: int, spot_ids: List[int], db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    _get_route_or_404(db, route_id)
+    ids = crud.detach_route_fishing_spots(db, route_id=route_id, spot_ids=spot_ids)
+    return {"route_id": route_id, "fishing_spot_ids": ids}
+
 @router.get("/reports/standard/")
+@query_budget(statements=1, rows=1)
 @require_role(models.UserRole.OPERATOR)
-async def get_standard_report():
+async def get_standard_report(current_user: models.User = Depends(auth.get_current_user)):
     return {"message": "Формирование стандартных отчетов. Реализовать по ТЗ."}
 
 @router.get("/export/")
+@query_budget(statements=1, rows=1)
 @require_role(models.UserRole.OPERATOR)
-async def export_data(format: str = Query("excel", enum=["excel", "pdf"])):
+async def export_data(format: str = Query("excel", enum=["excel", "pdf"]), current_user: models.User = Depends(auth.get_current_user)):
     return {"message": f"Экспорт данных в {format.upper()} (заглушка)"}
 
 @router.get("/routes/search/", response_model=List[schemas.Route])
+@query_budget(statements=2, rows=25)
 @require_role(models.UserRole.OPERATOR)
 async def search_routes(
     db: Session = Depends(get_db),
     ship_id: Optional[int] = None,
     captain_id: Optional[int] = None,
     date_from: Optional[datetime] = None,
-    date_to: Optional[datetime] = None
+    date_to: Optional[datetime] = None,
+    current_user: models.User = Depends(auth.get_current_user)
 ):
     query = db.query(models.Route)
     if ship_id:
@@ -95,21 +145,18 @@ async def search_routes(
     return query.all()
 
 @router.get("/catch/statistics/")
+@query_budget(statements=2, rows=2)
 @require_role(models.UserRole.OPERATOR)
 async def catch_statistics(
     db: Session = Depends(get_db),
     date_from: Optional[datetime] = None,
-    date_to: Optional[datetime] = None
+    date_to: Optional[datetime] = None,
+    current_user: models.User = Depends(auth.get_current_user)
 ):
-    query = db.query(models.Catch)
-    if date_from:
-        query = query.filter(models.Catch.route.has(models.Route.departure_time >= date_from))
-    if date_to:
-        query = query.filter(models.Catch.route.has(models.Route.return_time <= date_to))
-    total_weight = sum([c.weight for c in query.all()])
-    return {"total_weight": total_weight, "count": query.count()}
+    return crud.get_catch_statistics(db, date_from=date_from, date_to=date_to)
 
 @router.delete("/ships/{ship_id}")
+@query_budget(statements=6, rows=30)
 @require_role(models.UserRole.OPERATOR)
 async def delete_ship(ship_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_ship = db.query(models.Ship).filter(
@@ -122,19 +169,25 @@ async def delete_ship(ship_id: int, db: Session = Depends(get_db), current_user:
     
     db.delete(db_ship)
     db.commit()
+    invalidation.publish("ships")
     return {"message": "Судно успешно удалено"}
 
 @router.get("/captains/", response_model=List[schemas.User])
+@query_budget(statements=2, rows=25)
 @require_role(models.UserRole.OPERATOR)
 async def get_captains(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.User).filter(models.User.role == models.UserRole.CAPTAIN).all()
+    return captains_cache.get(None, lambda: [
+        schemas.User.model_validate(u) for u in db.query(models.User).filter(models.User.role == models.UserRole.CAPTAIN).all()
+    ])
 
 @router.get("/routes/", response_model=List[schemas.Route])
+@query_budget(statements=2, rows=25)
 @require_role(models.UserRole.OPERATOR)
 async def get_routes(db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     return db.query(models.Route).filter(models.Route.operator_id == current_user.id).all()
 
 @router.delete("/routes/{route_id}")
+@query_budget(statements=10, rows=80)
 @require_role(models.UserRole.OPERATOR)
 async def delete_route(route_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
     route = db.query(models.Route).filter(
@@ -147,4 +200,37 @@ async def delete_route(route_id: int, db: Session = Depends(get_db), current_use
     
     db.delete(route)
     db.commit()
-    return {"message": "Рейс успешно удален"} 
\ No newline at end of file
+    return {"message": "Рейс успешно удален"}
+
+@router.get("/dashboard/", response_model=schemas.OperatorDashboard)
+@query_budget(statements=6, rows=80)
+@require_role(models.UserRole.OPERATOR)
+async def get_dashboard(current_user: models.User = Depends(auth.get_current_user)):
+    return await dashboard.load(current_user.id)
+
+@router.get("/fleet/positions/", response_model=List[schemas.ShipPosition])
+@query_budget(statements=1, rows=1)
+@require_role(models.UserRole.OPERATOR)
+async def get_fleet_positions(current_user: models.User = Depends(auth.get_current_user)):
+    return list(telemetry.latest.values())
+
+@router.get("/ships/{ship_id}/track/", response_model=List[schemas.ShipPosition])
+@query_budget(statements=3, rows=500)
+@require_role(models.UserRole.OPERATOR)
+async def get_ship_track(ship_id: int, date_from: datetime, date_to: Optional[datetime] = None, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return telemetry.track(db, ship_id, date_from, date_to or datetime.utcnow())
+
+@router.post("/diagnostics/profile/", response_class=PlainTextResponse)
+@query_budget(statements=1, rows=1)
+@require_role(models.UserRole.OPERATOR)
+async def profile(seconds: float = Query(10, gt=0, le=60), interval_ms: float = Query(5, ge=1, le=100), current_user: models.User = Depends(auth.get_current_user)):
+    stacks = await run_in_threadpool(diagnostics.sample_stacks, seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="Профилирование уже запущено")
+    return stacks
+
+@router.get("/diagnostics/slow_requests/")
+@query_budget(statements=1, rows=1)
+@require_role(models.UserRole.OPERATOR)
+async def get_slow_requests(current_user: models.User = Depends(auth.get_current_user)):
+    return {"threshold_ms": diagnostics.SLOW_REQUEST_MS, "requests": list(diagnostics.slow_requests)}
@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from . import models, auth
+
+# Токен-бакеты на пользователя: (роль, группа маршрутов) -> (ёмкость, пополнение токенов в секунду)
+RATE_LIMITS = {
+    (models.UserRole.CAPTAIN, "reports"): (20, 2.0),
+    (models.UserRole.OPERATOR, "reports"): (40, 5.0),
+    (models.UserRole.CAPTAIN, "captain"): (30, 3.0),
+    (models.UserRole.OPERATOR, "operator"): (60, 10.0),
+}
+DEFAULT_RATE_LIMIT = (30, 3.0)
+MAX_BUCKETS = 10000
+
+# Глобальные лимиты одновременных запросов на воркер по классам эндпоинтов
+CONCURRENCY_LIMITS = {
+    "auth": 8,
+    "heavy": 4,
+    "write": 32,
+}
+HEAVY_PATHS = (
+    "/operator/catch/statistics/",
+    "/operator/dashboard/",
+)
+AUTH_PATHS = ("/token", "/register")
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        # Возвращает 0 при успехе или число секунд до появления токена
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self):
+        self._buckets = {}
+        # Синхронные обработчики выполняются в пуле потоков
+        self._lock = threading.Lock()
+
+    def hit(self, user_id: int, role: models.UserRole, group: str) -> float:
+        now = time.monotonic()
+        key = (user_id, group)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    self._prune(now)
+                capacity, rate = RATE_LIMITS.get((role, group), DEFAULT_RATE_LIMIT)
+                bucket = self._buckets[key] = TokenBucket(capacity, rate)
+            return bucket.take(now)
+
+    def _prune(self, now: float):
+        # Полностью пополнившиеся бакеты ничем не отличаются от новых
+        for key, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.capacity:
+                del self._buckets[key]
+
+
+limiter = RateLimiter()
+
+
+def rate_limit(group: str):
+    async def dependency(current_user: models.User = Depends(auth.get_current_user)):
+        retry_after = limiter.hit(current_user.id, current_user.role, group)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов, повторите позже",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+    return dependency
+
+
+def endpoint_class(request: Request):
+    path = request.url.path
+    if path in AUTH_PATHS:
+        return "auth"
+    if path.startswith(HEAVY_PATHS):
+        return "heavy"
+    if request.method in WRITE_METHODS:
+        return "write"
+    return None
+
+
+_in_flight = {name: 0 for name in CONCURRENCY_LIMITS}
+
+
+async def concurrency_limit_middleware(request: Request, call_next):
+    # Middleware выполняется в цикле событий, поэтому счётчики не требуют блокировок
+    name = endpoint_class(request)
+    if name is None:
+        return await call_next(request)
+    if _in_flight[name] >= CONCURRENCY_LIMITS[name]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Сервер перегружен, повторите позже"},
+            headers={"Retry-After": "1"},
+        )
+    _in_flight[name] += 1
+    try:
+        return await call_next(request)
+    finally:
+        _in_flight[name] -= 1
@@ -0,0 +1,369 @@
+import fcntl
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from . import models
+
+# Локальный журнал предзаписи для отчетов. POST /reports дописывает запись в
+# сегментный файл и отвечает после группового fsync; фоновый поток переносит
+# записи в Postgres крупными пакетами. Номер последней перенесенной записи
+# хранится в report_log_checkpoints в той же транзакции, что и вставка, поэтому
+# после перезапуска каждая запись попадает в базу ровно один раз. Ключ контрольной
+# точки — идентификатор каталога журнала из файла log.id, а не имя слота: имена
+# слотов совпадают на разных хостах. Запись, которую
+# база отвергла (например, рейс удален до переноса), откладывается в rejected.jsonl
+# слота и не задерживает остальные.
+REPORT_INGEST_MODE = os.getenv("SEALOG_REPORT_INGEST", "sync")
+REPORT_LOG_DIR = os.getenv("SEALOG_REPORT_LOG_DIR", "report_log")
+SEGMENT_SIZE = 64 * 1024 * 1024
+SYNC_INTERVAL = 0.005
+FLUSH_BATCH_SIZE = 5000
+FLUSH_INTERVAL = 0.5
+MAX_SLOTS = 64
+ORPHAN_SWEEP_INTERVAL = 30.0
+REJECTED_FILE = "rejected.jsonl"
+LOG_ID_FILE = "log.id"
+
+_HEADER = struct.Struct("<II")
+
+
+class ReportLogError(RuntimeError):
+    pass
+
+
+def _fsync_dir(path: str):
+    # Создание и удаление файлов надежны только после fsync самого каталога
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ReportLog:
+    def __init__(self, directory: str):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            _fsync_dir(os.path.dirname(os.path.abspath(directory)))
+        self.log_id = self._load_id()
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._closed = False
+        self._failed = None
+        self._recover()
+        self.synced_seq = self.last_seq
+        # Позиции в журнале сразу после записи с данным номером: фоновый перенос
+        # продолжает чтение с места, где остановился, не разбирая сегмент заново
+        self._positions = {}
+        self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True)
+        self._sync_thread.start()
+
+    def _load_id(self):
+        path = os.path.join(self.directory, LOG_ID_FILE)
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            pass
+        # Каталог, заведенный до появления log.id, сохраняет прежний ключ — имя слота,
+        # чтобы не перенести повторно уже перенесенные записи
+        if any(f.endswith(".log") for f in os.listdir(self.directory)):
+            log_id = os.path.basename(os.path.normpath(self.directory))
+        else:
+            log_id = uuid.uuid4().hex
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(log_id)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(self.directory)
+        return log_id
+
+    def _segments(self):
+        return sorted(f for f in os.listdir(self.directory) if f.endswith(".log"))
+
+    def _read_segment(self, name: str, after_seq: int = 0, max_seq: int = None, start: int = 0, limit: int = None):
+        # Возвращает записи сегмента, начиная с байта start, и позицию конца последней прочитанной записи
+        records, end = [], 0
+        with open(os.path.join(self.directory, name), "rb") as f:
+            f.seek(start)
+            data = f.read()
+        while end + _HEADER.size <= len(data):
+            if limit is not None and len(records) >= limit:
+                break
+            length, crc = _HEADER.unpack_from(data, end)
+            payload = data[end + _HEADER.size:end + _HEADER.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            record = json.loads(payload)
+            if max_seq is not None and record["seq"] > max_seq:
+                break
+            end += _HEADER.size + length
+            if record["seq"] > after_seq:
+                records.append(record)
+        return records, start + end
+
+    def _recover(self):
+        # Хвост последнего сегмента мог быть записан не полностью: обрезаем его
+        segments = self._segments()
+        self.last_seq = 0
+        if segments:
+            name = segments[-1]
+            records, end = self._read_segment(name)
+            self.last_seq = records[-1]["seq"] if records else int(name[:-4]) - 1
+            path = os.path.join(self.directory, name)
+            os.truncate(path, end)
+            self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            self._size = end
+        else:
+            self._open_segment(1)
+
+    def _open_segment(self, first_seq: int):
+        path = os.path.join(self.directory, f"{first_seq:020d}.log")
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        _fsync_dir(self.directory)
+        self._size = 0
+
+    def append(self, record: dict) -> int:
+        with self._lock:
+            if self._failed is not None:
+                raise ReportLogError(f"Журнал отчетов недоступен: {self._failed}")
+            seq = self.last_seq + 1
+            payload = json.dumps(dict(record, seq=seq), ensure_ascii=False, default=str).encode("utf-8")
+            if self._size and self._size + _HEADER.size + len(payload) > SEGMENT_SIZE:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._open_segment(seq)
+            os.write(self._fd, _HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._size += _HEADER.size + len(payload)
+            self.last_seq = seq
+            # Ответ клиенту только после того, как запись попала на диск
+            while self.synced_seq < seq and self._failed is None:
+                self._synced.wait()
+            if self.synced_seq < seq:
+                raise ReportLogError(f"Журнал отчетов недоступен: {self._failed}")
+        return seq
+
+    def _sync_loop(self):
+        # Групповой fsync: одна синхронизация подтверждает все записи, накопленные за интервал
+        while not self._closed:
+            time.sleep(SYNC_INTERVAL)
+            with self._lock:
+                if self.synced_seq == self.last_seq:
+                    continue
+                try:
+                    os.fsync(self._fd)
+                except OSError as e:
+                    # После сбоя fsync состояние страниц неизвестно: журнал больше
+                    # не принимает записи, ожидающие получают ошибку вместо вечного ожидания
+                    print(f"Report log fsync error: {str(e)}")
+                    self._failed = e
+                    self._synced.notify_all()
+                    return
+                self.synced_seq = self.last_seq
+                self._synced.notify_all()
+
+    def read_after(self, seq: int, limit: int):
+        max_seq = self.synced_seq
+        records = []
+        segments = self._segments()
+        position = self._positions.get(seq)
+        if position is not None:
+            # Сегмент позиции мог быть удален как полностью перенесенный — тогда читаем следующие с начала
+            segments = [name for name in segments if name >= position[0]]
+        last = position
+        for i, name in enumerate(segments):
+            if position is None and i + 1 < len(segments) and int(segments[i + 1][:-4]) <= seq + 1:
+                continue
+            start = position[1] if position is not None and name == position[0] else 0
+            chunk, end = self._read_segment(name, after_seq=seq, max_seq=max_seq, start=start, limit=limit - len(records))
+            records.extend(chunk)
+            last = (name, end)
+            # Сегмент дочитан не до конца (лимит или еще не синхронизированные записи) —
+            # следующие сегменты читать рано
+            if len(records) >= limit or end < os.path.getsize(os.path.join(self.directory, name)):
+                break
+        # Храним позицию для повтора того же чтения и для следующего после успешного переноса
+        self._positions = {}
+        if position is not None:
+            self._positions[seq] = position
+        if last is not None:
+            self._positions[records[-1]["seq"] if records else seq] = last
+        return records
+
+    def truncate_through(self, seq: int):
+        # Удаляем сегменты, все записи которых уже перенесены в базу
+        segments = self._segments()
+        removed = False
+        for name, following in zip(segments, segments[1:]):
+            if int(following[:-4]) - 1 <= seq:
+                os.remove(os.path.join(self.directory, name))
+                removed = True
+        if removed:
+            _fsync_dir(self.directory)
+
+    def close(self):
+        self._closed = True
+        self._sync_thread.join()
+        with self._lock:
+            if self._failed is None:
+                os.fsync(self._fd)
+            os.close(self._fd)
+
+
+def _try_lock(root: str, slot: str):
+    lock_file = open(os.path.join(root, f"{slot}.lock"), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def claim_slot(root: str):
+    # Каждый воркер пишет в свой слот; блокировка освобождается при завершении процесса,
+    # и слот вместе с недоставленными записями подхватывает следующий воркер
+    os.makedirs(root, exist_ok=True)
+    for i in range(MAX_SLOTS):
+        name = f"slot-{i}"
+        lock_file = _try_lock(root, name)
+        if lock_file is not None:
+            return name, lock_file
+    raise RuntimeError("Нет свободных слотов журнала отчетов")
+
+
+class ReportFlusher:
+    def __init__(self, session_factory, root: str = REPORT_LOG_DIR):
+        self.session_factory = session_factory
+        self.root = root
+        self.slot, self._lock_file = claim_slot(root)
+        self.log = ReportLog(os.path.join(root, self.slot))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self.log.close()
+        self._lock_file.close()
+
+    def append(self, report: dict, user_id: int) -> int:
+        return self.log.append(dict(report, user_id=user_id, created_at=datetime.utcnow().isoformat()))
+
+    def _insert(self, db, records):
+        db.execute(insert(models.Report.__table__), [
+            {
+                "fish_type": r["fish_type"],
+                "weight": r["weight"],
+                "location": r["location"],
+                "notes": r.get("notes"),
+                "route_id": r.get("route_id"),
+                "user_id": r["user_id"],
+                "created_at": datetime.fromisoformat(r["created_at"]),
+            }
+            for r in records
+        ])
+
+    def _insert_each(self, db, log, records):
+        # Пакет отвергнут: вставляем по одной записи в точках сохранения,
+        # отвергнутые записи откладываем вместо бесконечного повтора пакета
+        rejected = []
+        for record in records:
+            try:
+                with db.begin_nested():
+                    self._insert(db, [record])
+            except IntegrityError as e:
+                rejected.append(dict(record, error=str(e.orig)))
+        if rejected:
+            with open(os.path.join(log.directory, REJECTED_FILE), "a", encoding="utf-8") as f:
+                for record in rejected:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"Report log: отложено отвергнутых записей: {len(rejected)}")
+
+    def _flush(self, log: ReportLog) -> int:
+        db = self.session_factory()
+        try:
+            checkpoint = db.get(models.ReportLogCheckpoint, log.log_id, with_for_update=True)
+            if checkpoint is None:
+                checkpoint = models.ReportLogCheckpoint(slot=log.log_id, last_sequence=0)
+                db.add(checkpoint)
+                db.flush()
+            if checkpoint.last_sequence > log.last_seq:
+                # Контрольная точка принадлежит другому журналу: пропуск и удаление
+                # сегментов стерли бы еще не перенесенные отчеты
+                raise RuntimeError(
+                    f"Контрольная точка {log.log_id} ({checkpoint.last_sequence}) "
+                    f"опережает журнал {log.directory} ({log.last_seq})"
+                )
+            records = log.read_after(checkpoint.last_sequence, FLUSH_BATCH_SIZE)
+            if records:
+                try:
+                    with db.begin_nested():
+                        self._insert(db, records)
+                except IntegrityError:
+                    self._insert_each(db, log, records)
+                checkpoint.last_sequence = records[-1]["seq"]
+            db.commit()
+            log.truncate_through(checkpoint.last_sequence)
+            return len(records)
+        finally:
+            db.close()
+
+    def flush(self) -> int:
+        return self._flush(self.log)
+
+    def drain_orphans(self) -> int:
+        # Слоты, которые никто не держит (например, воркеров после перезапуска стало
+        # меньше), переносим сами, иначе принятые в них отчеты так и не попадут в базу
+        drained = 0
+        for name in sorted(os.listdir(self.root)):
+            slot = name[:-5]
+            if not name.endswith(".lock") or slot == self.slot or not os.path.isdir(os.path.join(self.root, slot)):
+                continue
+            lock_file = _try_lock(self.root, slot)
+            if lock_file is None:
+                continue
+            try:
+                log = ReportLog(os.path.join(self.root, slot))
+                try:
+                    while True:
+                        flushed = self._flush(log)
+                        drained += flushed
+                        if flushed < FLUSH_BATCH_SIZE:
+                            break
+                finally:
+                    log.close()
+            finally:
+                lock_file.close()
+        return drained
+
+    def _run(self):
+        last_sweep = 0.0
+        while not self._stop.is_set():
+            try:
+                flushed = self.flush()
+                if time.monotonic() - last_sweep >= ORPHAN_SWEEP_INTERVAL:
+                    last_sweep = time.monotonic()
+                    self.drain_orphans()
+            except Exception as e:
+                print(f"Report log flush error: {str(e)}")
+                flushed = 0
+            # Пока журнал не пуст, переносим без паузы
+            if flushed < FLUSH_BATCH_SIZE:
+                self._stop.wait(FLUSH_INTERVAL)
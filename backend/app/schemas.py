@@ -18,7 +18,7 @@ class User(UserBase):
     is_active: bool
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class Token(BaseModel):
     access_token: str
@@ -41,7 +41,16 @@ class Ship(ShipBase):
     id: int
     user_id: int
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class ShipPosition(BaseModel):
+    ship_id: int
+    recorded_at: datetime
+    status: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    speed: Optional[float] = None
+    samples: int = 1
 
 class CatchBase(BaseModel):
     fish_type: FishType
@@ -72,7 +81,15 @@ class FishingSpotCreate(FishingSpotBase):
 class FishingSpot(FishingSpotBase):
     id: int
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class RouteFishingSpots(BaseModel):
+    route_id: int
+    fishing_spot_ids: List[int]
+
+class UserFishingSpots(BaseModel):
+    user_id: int
+    fishing_spot_ids: List[int]
 
 class RouteBase(BaseModel):
     ship_id: int
@@ -123,3 +140,39 @@ class Report(ReportInDB):
 
     class Config:
         from_attributes = True
+
+class DashboardCounts(BaseModel):
+    ships: int
+    routes: int
+    captains: int
+
+class DashboardRoute(BaseModel):
+    id: int
+    code: Optional[str] = None
+    ship_id: int
+    captain_id: int
+    departure_time: Optional[datetime] = None
+    return_time: Optional[datetime] = None
+
+class DashboardReport(BaseModel):
+    id: int
+    fish_type: str
+    weight: float
+    location: str
+    created_at: datetime
+    user_id: int
+    route_id: Optional[int] = None
+
+class DashboardPendingReports(BaseModel):
+    count: int
+    latest: List[DashboardReport]
+
+class CatchStatistics(BaseModel):
+    total_weight: float
+    count: int
+
+class OperatorDashboard(BaseModel):
+    counts: DashboardCounts
+    active_routes: List[DashboardRoute]
+    pending_reports: DashboardPendingReports
+    recent_catch: CatchStatistics
@@ -0,0 +1,230 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from . import models
+
+# Телеметрия судов: точки копятся в памяти и пакетно дописываются в
+# ship_telemetry, последнее состояние каждого судна хранится в словаре для
+# O(1)-ответа «где сейчас флот». Точки из буфера, не успевшие записаться до
+# падения процесса, теряются — для телеметрии с периодом в секунды это допустимо.
+# Старые точки прореживаются в ship_telemetry_rollups: сырые — в минутные
+# интервалы, минутные — в часовые.
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH_SIZE = 5000
+MAX_BUFFERED_POINTS = 200000
+LATEST_REFRESH_INTERVAL = 10.0
+# Окна соседних обновлений перекрываются: другие воркеры пишут точки с задержкой
+# до FLUSH_INTERVAL, а время точки берется по часам их хоста
+LATEST_REFRESH_OVERLAP = timedelta(seconds=30)
+DOWNSAMPLE_INTERVAL = 300.0
+DOWNSAMPLE_LOCK_ID = 7_310_002
+# (исходный размер интервала в секундах или 0 для сырых точек, новый размер, возраст для прореживания)
+DOWNSAMPLE_TIERS = [
+    (0, 60, timedelta(days=1)),
+    (60, 3600, timedelta(days=30)),
+]
+
+_buffer = []
+_buffer_lock = threading.Lock()
+latest = {}
+_latest_refreshed = datetime.min
+_stop = threading.Event()
+_thread = None
+
+
+def record(ship_id: int, status: str, latitude=None, longitude=None, speed=None):
+    point = {
+        "ship_id": ship_id,
+        "recorded_at": datetime.utcnow(),
+        "status": status,
+        "latitude": latitude,
+        "longitude": longitude,
+        "speed": speed,
+    }
+    with _buffer_lock:
+        if len(_buffer) >= MAX_BUFFERED_POINTS:
+            # База не успевает: отбрасываем самые старые точки, последнее состояние не теряется
+            del _buffer[:FLUSH_BATCH_SIZE]
+        _buffer.append(point)
+    latest[ship_id] = point
+    return point
+
+
+def flush(db):
+    with _buffer_lock:
+        batch = _buffer[:FLUSH_BATCH_SIZE]
+        del _buffer[:FLUSH_BATCH_SIZE]
+    if not batch:
+        return 0
+    try:
+        db.execute(insert(models.ShipTelemetry.__table__), batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        with _buffer_lock:
+            _buffer[:0] = batch
+        raise
+    return len(batch)
+
+
+def refresh_latest(db):
+    # Подтягиваем точки, принятые другими воркерами
+    global _latest_refreshed
+    since = _latest_refreshed
+    _latest_refreshed = datetime.utcnow() - LATEST_REFRESH_OVERLAP
+    rows = db.execute(text(
+        "SELECT DISTINCT ON (ship_id) ship_id, recorded_at, status, latitude, longitude, speed "
+        "FROM ship_telemetry WHERE recorded_at > :since ORDER BY ship_id, recorded_at DESC"
+    ), {"since": since}).mappings()
+    for row in rows:
+        current = latest.get(row["ship_id"])
+        if current is None or current["recorded_at"] < row["recorded_at"]:
+            latest[row["ship_id"]] = dict(row)
+
+
+def load_latest(db):
+    # Начальная загрузка: у судов, молчащих дольше суток, сырых точек уже нет —
+    # берем последний интервал прореживания, затем уточняем по сырым точкам
+    rows = db.execute(text(
+        "SELECT DISTINCT ON (ship_id) ship_id, bucket_start AS recorded_at, status, latitude, longitude, speed "
+        "FROM ship_telemetry_rollups ORDER BY ship_id, bucket_start DESC"
+    )).mappings()
+    for row in rows:
+        current = latest.get(row["ship_id"])
+        if current is None or current["recorded_at"] < row["recorded_at"]:
+            latest[row["ship_id"]] = dict(row)
+    refresh_latest(db)
+
+
+_ROLLUP_RAW = """
+INSERT INTO ship_telemetry_rollups (ship_id, bucket_seconds, bucket_start, status, latitude, longitude, speed, samples)
+SELECT ship_id, :size,
+       to_timestamp(floor(extract(epoch FROM recorded_at) / :size) * :size) AT TIME ZONE 'UTC',
+       (array_agg(status ORDER BY recorded_at DESC))[1],
+       avg(latitude), avg(longitude), avg(speed), count(*)
+FROM ship_telemetry WHERE recorded_at < :cutoff
+GROUP BY 1, 3
+ON CONFLICT (ship_id, bucket_seconds, bucket_start) DO UPDATE SET
+    status = EXCLUDED.status,
+    latitude = (ship_telemetry_rollups.latitude * ship_telemetry_rollups.samples + EXCLUDED.latitude * EXCLUDED.samples)
+               / (ship_telemetry_rollups.samples + EXCLUDED.samples),
+    longitude = (ship_telemetry_rollups.longitude * ship_telemetry_rollups.samples + EXCLUDED.longitude * EXCLUDED.samples)
+                / (ship_telemetry_rollups.samples + EXCLUDED.samples),
+    speed = (ship_telemetry_rollups.speed * ship_telemetry_rollups.samples + EXCLUDED.speed * EXCLUDED.samples)
+            / (ship_telemetry_rollups.samples + EXCLUDED.samples),
+    samples = ship_telemetry_rollups.samples + EXCLUDED.samples
+"""
+
+_ROLLUP_COARSER = """
+INSERT INTO ship_telemetry_rollups (ship_id, bucket_seconds, bucket_start, status, latitude, longitude, speed, samples)
+SELECT ship_id, :size,
+       to_timestamp(floor(extract(epoch FROM bucket_start) / :size) * :size) AT TIME ZONE 'UTC',
+       (array_agg(status ORDER BY bucket_start DESC))[1],
+       sum(latitude * samples) / sum(samples), sum(longitude * samples) / sum(samples),
+       sum(speed * samples) / sum(samples), sum(samples)
+FROM ship_telemetry_rollups WHERE bucket_seconds = :source AND bucket_start < :cutoff
+GROUP BY 1, 3
+ON CONFLICT (ship_id, bucket_seconds, bucket_start) DO UPDATE SET
+    status = EXCLUDED.status,
+    latitude = (ship_telemetry_rollups.latitude * ship_telemetry_rollups.samples + EXCLUDED.latitude * EXCLUDED.samples)
+               / (ship_telemetry_rollups.samples + EXCLUDED.samples),
+    longitude = (ship_telemetry_rollups.longitude * ship_telemetry_rollups.samples + EXCLUDED.longitude * EXCLUDED.samples)
+                / (ship_telemetry_rollups.samples + EXCLUDED.samples),
+    speed = (ship_telemetry_rollups.speed * ship_telemetry_rollups.samples + EXCLUDED.speed * EXCLUDED.samples)
+            / (ship_telemetry_rollups.samples + EXCLUDED.samples),
+    samples = ship_telemetry_rollups.samples + EXCLUDED.samples
+"""
+
+
+def downsample(db, now: datetime = None):
+    now = now or datetime.utcnow()
+    # Прореживание выполняет только один воркер
+    if not db.execute(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": DOWNSAMPLE_LOCK_ID}).scalar():
+        db.rollback()
+        return False
+    for source, size, age in DOWNSAMPLE_TIERS:
+        # Граница выровнена по новому интервалу, чтобы не дробить его между проходами
+        epoch = (now - age - datetime(1970, 1, 1)).total_seconds()
+        cutoff = datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % size)
+        if source == 0:
+            db.execute(text(_ROLLUP_RAW), {"size": size, "cutoff": cutoff})
+            db.execute(text("DELETE FROM ship_telemetry WHERE recorded_at < :cutoff"), {"cutoff": cutoff})
+        else:
+            db.execute(text(_ROLLUP_COARSER), {"size": size, "source": source, "cutoff": cutoff})
+            db.execute(
+                text("DELETE FROM ship_telemetry_rollups WHERE bucket_seconds = :source AND bucket_start < :cutoff"),
+                {"source": source, "cutoff": cutoff}
+            )
+    db.commit()
+    return True
+
+
+def track(db, ship_id: int, date_from: datetime, date_to: datetime):
+    raw = db.query(models.ShipTelemetry).filter(
+        models.ShipTelemetry.ship_id == ship_id,
+        models.ShipTelemetry.recorded_at >= date_from,
+        models.ShipTelemetry.recorded_at <= date_to
+    ).order_by(models.ShipTelemetry.recorded_at).all()
+    rollups = db.query(models.ShipTelemetryRollup).filter(
+        models.ShipTelemetryRollup.ship_id == ship_id,
+        models.ShipTelemetryRollup.bucket_start >= date_from,
+        models.ShipTelemetryRollup.bucket_start <= date_to
+    ).all()
+    points = [
+        {"ship_id": r.ship_id, "recorded_at": r.bucket_start, "status": r.status, "latitude": r.latitude,
+         "longitude": r.longitude, "speed": r.speed, "samples": r.samples}
+        for r in rollups
+    ] + [
+        {"ship_id": r.ship_id, "recorded_at": r.recorded_at, "status": r.status, "latitude": r.latitude,
+         "longitude": r.longitude, "speed": r.speed, "samples": 1}
+        for r in raw
+    ]
+    return sorted(points, key=lambda p: p["recorded_at"])
+
+
+def _run(session_factory):
+    last_refresh = last_downsample = 0.0
+    while not _stop.is_set():
+        db = session_factory()
+        try:
+            while flush(db) == FLUSH_BATCH_SIZE:
+                pass
+            now = time.monotonic()
+            if now - last_refresh >= LATEST_REFRESH_INTERVAL:
+                refresh_latest(db)
+                db.rollback()
+                last_refresh = now
+            if now - last_downsample >= DOWNSAMPLE_INTERVAL:
+                downsample(db)
+                last_downsample = now
+        except Exception as e:
+            print(f"Telemetry error: {str(e)}")
+        finally:
+            db.close()
+        _stop.wait(FLUSH_INTERVAL)
+
+
+def start(session_factory):
+    global _thread
+    db = session_factory()
+    try:
+        load_latest(db)
+    finally:
+        db.close()
+    _stop.clear()
+    _thread = threading.Thread(target=_run, args=(session_factory,), daemon=True)
+    _thread.start()
+
+
+def stop(session_factory):
+    if _thread is None:
+        return
+    _stop.set()
+    _thread.join()
+    db = session_factory()
+    try:
+        while flush(db):
+            pass
+    finally:
+        db.close()
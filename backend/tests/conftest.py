@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Тесты запускаются из каталога backend: python -m pytest tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# База для тестов задается до импорта приложения: engine создается при импорте app.database
+if os.getenv("SEALOG_BUDGET_DATABASE_URL"):
+    os.environ["DATABASE_URL"] = os.environ["SEALOG_BUDGET_DATABASE_URL"]
+    os.environ.setdefault("SEALOG_INVALIDATION_BUS", "none")
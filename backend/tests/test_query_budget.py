@@ -0,0 +1,173 @@
+import os
+import threading
+from datetime import date, datetime, timedelta
+import pytest
+
+# Проверка бюджетов SQL по всем маршрутам приложения. Для каждого маршрута база
+# очищается и заполняется заново, запрос выполняется через TestClient, а число
+# SQL-запросов и выбранных строк сравнивается с @query_budget обработчика.
+#
+#   SEALOG_BUDGET_DATABASE_URL=postgresql://.../sealog_budget python -m pytest tests
+#
+# Все таблицы указанной базы очищаются, поэтому рабочую базу указывать нельзя.
+if not os.getenv("SEALOG_BUDGET_DATABASE_URL"):
+    pytest.skip("SEALOG_BUDGET_DATABASE_URL не задан", allow_module_level=True)
+
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from app import auth, invalidation, models, rate_limit
+from app.database import engine, SessionLocal, Base
+from app.main import app
+
+SEED_SIZE = 20
+SEED_PASSWORD = "budget-password"
+OPERATOR_EMAIL = "operator@budget.example.com"
+CAPTAIN_EMAIL = "captain@budget.example.com"
+OTHER_CAPTAIN_EMAIL = "captain2@budget.example.com"
+
+# Пути, которые выполняются от имени капитана; остальные защищенные — от имени оператора
+CAPTAIN_PATHS = ("/captain/",)
+CAPTAIN_REQUESTS = {("POST", "/reports")}
+PUBLIC_PATHS = {"/", "/register", "/token"}
+
+SAMPLE_REQUESTS = {
+    ("POST", "/register"): {"json": {"email": "new@budget.example.com", "password": "secret", "role": "captain"}},
+    ("POST", "/token"): {"data": {"username": OPERATOR_EMAIL, "password": SEED_PASSWORD}},
+    ("POST", "/reports"): {"json": {"fish_type": "треска", "weight": 10.5, "location": "Баренцево море", "route_id": 1}},
+    ("POST", "/operator/routes/"): {"json": {"ship_id": 1, "operator_id": 1, "captain_id": 2, "code": "R-NEW"}},
+    ("POST", "/operator/catch/"): {"json": {"fish_type": "треска", "weight": 5.0, "user_id": 2, "route_id": 1}},
+    ("POST", "/operator/ships/"): {"json": {"name": "Новое", "type": "траулер", "displacement": 900.0, "build_date": "2001-01-01", "user_id": 1}},
+    ("PUT", "/operator/ships/{ship_id}"): {"json": {"name": "Переименованное", "type": "траулер", "displacement": 900.0, "build_date": "2001-01-01", "user_id": 1}},
+    ("POST", "/operator/routes/{route_id}/fishing_spots/"): {"json": [1, 2, 3]},
+    ("POST", "/operator/routes/{route_id}/fishing_spots/bulk/"): {"json": [1, 2, 3]},
+    ("PUT", "/operator/routes/{route_id}/fishing_spots/"): {"json": [1, 2, 3]},
+    ("DELETE", "/operator/routes/{route_id}/fishing_spots/"): {"json": [1, 2, 3]},
+    ("POST", "/captain/fishing_spots/"): {"json": {"name": "Новая", "coordinates": "69.0,33.0", "depth": 120.0, "fish_type": "треска"}},
+    ("POST", "/captain/my_fishing_spots/"): {"json": [1, 2, 3]},
+    ("PUT", "/captain/my_fishing_spots/"): {"json": [1, 2, 3]},
+    ("DELETE", "/captain/my_fishing_spots/"): {"json": [1, 2, 3]},
+    ("POST", "/captain/routes/{route_id}/comment/"): {"params": {"comment": "Проверка"}},
+    ("PUT", "/captain/fishing_spots/{spot_id}/time/"): {"params": {"arrival_time": "2024-01-01T10:00:00"}},
+    ("POST", "/captain/ships/{ship_id}/status/"): {"params": {"status": "в море"}},
+    ("POST", "/operator/diagnostics/profile/"): {"params": {"seconds": 0.1}},
+    ("GET", "/operator/ships/{ship_id}/track/"): {"params": {"date_from": "2024-01-01T00:00:00"}},
+}
+PATH_PARAMS = {"route_id": 1, "ship_id": 1, "spot_id": 1, "report_id": 1, "fish_type": "треска", "zoom": 0, "x": 0, "y": 0}
+
+ROUTES = [
+    pytest.param(method, route, id=f"{method} {route.path}")
+    for route in app.routes if isinstance(route, APIRoute)
+    for method in sorted(route.methods)
+]
+
+
+class QueryCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements = 0
+            self.rows = 0
+
+    def count(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements += 1
+            # rowcount у SELECT в psycopg2 — число полученных строк
+            if cursor.description is not None and cursor.rowcount > 0:
+                self.rows += cursor.rowcount
+
+
+def seed(db, password_hash: str):
+    operator = models.User(email=OPERATOR_EMAIL, hashed_password=password_hash, role=models.UserRole.OPERATOR)
+    captain = models.User(email=CAPTAIN_EMAIL, hashed_password=password_hash, role=models.UserRole.CAPTAIN)
+    other = models.User(email=OTHER_CAPTAIN_EMAIL, hashed_password=password_hash, role=models.UserRole.CAPTAIN)
+    db.add_all([operator, captain, other])
+    db.flush()
+    now = datetime.utcnow()
+    ships = [
+        models.Ship(user_id=operator.id, name=f"Судно {i}", type=models.ShipType.TRAWLER, displacement=1000.0, build_date=date(2000, 1, 1))
+        for i in range(SEED_SIZE)
+    ]
+    spots = [
+        models.FishingSpot(name=f"Точка {i}", coordinates="69.0,33.0", depth=100.0, fish_type=models.FishType.COD)
+        for i in range(SEED_SIZE)
+    ]
+    db.add_all(ships + spots)
+    db.flush()
+    routes = [
+        models.Route(
+            ship_id=ships[i].id, operator_id=operator.id, captain_id=captain.id, code=f"R-{i}",
+            departure_time=now - timedelta(days=10 + i), return_time=now - timedelta(days=i),
+            fishing_spots=spots[:5]
+        )
+        for i in range(SEED_SIZE)
+    ]
+    db.add_all(routes)
+    db.flush()
+    for i, route in enumerate(routes):
+        db.add(models.Catch(user_id=captain.id, route_id=route.id, fish_type=models.FishType.COD, weight=100.0 + i))
+        for user in (captain, other):
+            db.add(models.Report(fish_type="треска", weight=10.0, location="Баренцево море", user_id=user.id, route_id=route.id))
+    captain.fishing_spots = spots[:5]
+    db.commit()
+
+
+def _user_for(method: str, path: str):
+    if path in PUBLIC_PATHS:
+        return None
+    if path.startswith(CAPTAIN_PATHS) or (method, path) in CAPTAIN_REQUESTS:
+        return CAPTAIN_EMAIL
+    return OPERATOR_EMAIL
+
+
+@pytest.fixture(scope="module")
+def counter():
+    counter = QueryCounter()
+    event.listen(engine, "after_cursor_execute", counter.count)
+    yield counter
+    event.remove(engine, "after_cursor_execute", counter.count)
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app, raise_server_exceptions=False)
+
+
+@pytest.fixture(scope="module")
+def password_hash():
+    return auth.get_password_hash(SEED_PASSWORD)
+
+
+@pytest.fixture
+def seeded(password_hash):
+    tables = ", ".join(t.name for t in Base.metadata.sorted_tables)
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+    db = SessionLocal()
+    try:
+        seed(db, password_hash)
+    finally:
+        db.close()
+    invalidation.clear_all()
+    rate_limit.limiter = rate_limit.RateLimiter()
+
+
+@pytest.mark.parametrize("method,route", ROUTES)
+def test_route_within_query_budget(method, route, seeded, client, counter):
+    budget = getattr(route.endpoint, "query_budget", None)
+    assert budget is not None, "не задан @query_budget"
+
+    kwargs = dict(SAMPLE_REQUESTS.get((method, route.path), {}))
+    email = _user_for(method, route.path)
+    if email:
+        kwargs["headers"] = {"Authorization": f"Bearer {auth.create_access_token({'sub': email})}"}
+    counter.reset()
+    response = client.request(method, route.path.format(**PATH_PARAMS), **kwargs)
+    statements, rows = counter.statements, counter.rows
+
+    assert response.status_code < 400, f"ответ {response.status_code} {response.text[:200]}"
+    assert statements <= budget["statements"], f"{statements} запросов при бюджете {budget['statements']}"
+    assert rows <= budget["rows"], f"{rows} строк при бюджете {budget['rows']}"
@@ -114,6 +114,12 @@ export const operator = {
     const response = await api.get('/operator/captains/');
     return response.data;
   },
+
+  // Сводка для главного экрана за один запрос
+  getDashboard: async () => {
+    const response = await api.get('/operator/dashboard/');
+    return response.data;
+  },
 };
 
 // Капитан